@@ -6,4 +6,4 @@ the configuration file in yaml format that will provide the
 registers available in your boiler. There is more information
 and examples in the diematicd.py file
 """
-from boiler import Boiler
\ No newline at end of file
+from .boiler import Boiler
\ No newline at end of file
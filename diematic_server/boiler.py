@@ -1,11 +1,140 @@
+import json
 import logging
 
+from collections import deque
 from datetime import datetime
 import threading
 from typing import Any
 
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, the standard library encoder is used when missing
+    orjson = None
+
 log = logging.getLogger()
 
+def dumps_bytes(data) -> bytes:
+    """ Serializes data to JSON encoded bytes, using orjson when available """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def loads_bytes(data: bytes):
+    """ Parses JSON encoded bytes, using orjson when available. Raises ValueError on invalid JSON """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+_MODEL_TABLE = {
+    0: '3-25LP',
+    1: '3-15LP',
+    2: '3-25SOLO',
+    3: '3-25K',
+    4: '3-15SOLO',
+    30: 'MC 35 E',
+    5: '3-E25LP',
+    31: 'MC 45',
+    6: 'DOMOLIGHT',
+    32: 'MC 65',
+    7: '3-35',
+    33: 'MC 90',
+    8: '3-50',
+    34: 'C210',
+    9: '3-25 BIC',
+    35: 'C310',
+    10: '3-15ECO',
+    36: 'C610',
+    11: '3-25ECO',
+    37: 'C230',
+    12: '3-35ECO',
+    13: '3-50ECO',
+    14: '3-65ECO',
+    40: 'Robur HP',
+    20: 'Diematic 3',
+    21: 'Diematic m2',
+    22: 'Diematic m3',
+    23: 'MIT',
+    24: 'D4',
+    25: 'MB/OT interface',
+}
+
+_ERRORCODE_TABLE = {
+    0x0000: 'OK',
+    0x0001: 'BOILER S.FAIL.',
+    0x0002: 'OUTL S.A FAIL.',
+    0x0003: 'OUTL S.B FAIL.',
+    0x0004: 'OUTL S.C FAIL.',
+    0x0005: 'OUTSI. S.FAIL.',
+    0x0006: 'SMOKE S. FAIL.',
+    0x0007: 'AUX. F. DEFEKT',
+    0x0009: 'DHW S. FAILURE',
+    0x000A: 'BACK S.FAILURE',
+    0x000B: 'ROOM S.A FAIL.',
+    0x000C: 'ROOM S.B FAIL.',
+    0x000D: 'ROOM S.C FAIL.',
+    0x000E: 'SOLAR S. FAIL',
+    0x000F: 'ST.TANK S.FAIL',
+    0x0010: 'SWIM.P.A S.FAIL',
+    0x0011: 'DHW 2 S. FAIL',
+    0x0012: 'CDI.A COM.FAIL',
+    0x0013: 'CDI.B COM.FAIL',
+    0x0014: 'CDI.C COM.FAIL',
+    0x001B: 'I-CURRENT FAIL',
+    0x001C: 'BURNER FAILURE',
+    0x001D: 'PARASIT FLAME',
+    0x001E: 'STB BOILER',
+    0x001F: 'STB BACK',
+    0x0020: 'VALVE FAIL',
+    0x0022: 'PCU BLOCKING',
+    0x0023: 'EXCHAN.S.FAIL',
+    0x0024: 'STB EXCHANGE',
+    0x0025: 'TA-S SHORT-CIR',
+    0x0026: 'TA-S DISCONNEC',
+    0x0027: 'TA-S FAILURE',
+    0x0028: 'MC COM.FAIL',
+    0x0029: 'AUX2.SENS.FAIL',
+    0x002A: 'UNIV.SENS.FAIL',
+    0x002B: 'SWIM.P.B S.FAIL',
+    0x002C: 'SWIM.P.C S.FAIL',
+    0x002D: 'PCU COM. FAIL',
+    0x002E: 'LOCKING',
+    0x002F: 'PSU FAIL',
+    0x0030: 'PSU PARAM FAIL',
+    0x0031: 'CCE TEST FAIL',
+    0x0032: 'FAN FAILURE',
+    0x0033: 'SMOKE.P.FAIL',
+    0x0034: 'SU COM.FAIL',
+    0x0035: 'PCU-M3 COM.FAIL',
+    0x0036: 'CS OPEN FAIL',
+    0x0037: 'EXCH-BACK<MIN',
+    0x0038: 'EXCH-BACK>MAX',
+    0x0039: 'BACK>BOIL FAIL',
+    0x003A: 'FAIL UNKNOWN',
+}
+
+_MODEFLAG_TABLE = {
+    0: -1,
+    2: 0,
+    4: 1,
+}
+_MODEFLAG_REVERSE_TABLE = {v: k for k, v in _MODEFLAG_TABLE.items()}
+
+_CIRCTYPE_TABLE = {
+    0: 'DISABLE',
+    1: 'DIRECT',
+    2: '3WV',
+    3: 'DIRECT+',
+    4: '3WV+',
+    5: 'SWIM.',
+}
+_CIRCTYPE_REVERSE_TABLE = {v: k for k, v in _CIRCTYPE_TABLE.items()}
+
+_POW10 = (1, 10, 100, 1000, 10000, 100000)
+
+# bits of every byte value, least significant first
+_BIT_LUT = [tuple((byte >> i) & 1 for i in range(8)) for byte in range(256)]
+
 class Boiler:
     """ Class representation of a De Dietrich boiler with capacity to read registers
         :param index: instance of the yaml configuration file
@@ -13,9 +142,26 @@ class Boiler:
     def __init__(self, uuid, index):
         self.uuid = uuid
         self.registers = []
+        self.vars = {}
         self.attribute_list = []
         self.index = index
+        # (register, bits, decoder) tuples walked by browse_registers, bits holds
+        # the (shift, varname, desc) of every used bit of a bits register and
+        # decoder is the function that converts the raw value of other registers
+        self._browse_index = []
+        # register definition of every variable name that can be written
+        self._reg_by_varname = {}
+        # position of every bit variable, mask of the used bits of each bits
+        # register and the last known value of those bits, used to compose writes
+        self._bit_shift = {}
+        self._bit_masks = {}
+        self._bits_value = {}
+        # variable names waiting to be written, in request order
+        self._pending = deque()
         self.lock = threading.Lock()
+        # fetch_data serialized to JSON, None when values changed since last built
+        self._json_bytes = None
+        self._poll_iso = None
         with self.lock: 
             for register in self.index:
                 influx = True
@@ -23,21 +169,40 @@ class Boiler:
                     influx = register['influx']
 
                 if 'type' in register and register['type'] == 'bits':
-                    for varname in register['bits']:
+                    bits = []
+                    mask = 0
+                    for i, varname in enumerate(register['bits']):
                         realvarname = varname if type(varname) is str else varname['name']
                         self._init_register_value(realvarname, register['id'], influx)
                         self.attribute_list.append(realvarname)
+                        if realvarname != 'io_unused':
+                            desc = varname.get('desc') if type(varname) is dict else None
+                            bits.append((i, realvarname, desc))
+                            mask |= 1 << i
+                            if isinstance(register['id'], int):
+                                self._reg_by_varname.setdefault(realvarname, register)
+                                self._bit_shift.setdefault(realvarname, i)
+                    self._bit_masks[register['id']] = mask
+                    if 'name' in register:
+                        # the raw value of a named bits register is kept but not published
+                        self._init_register_value(register['name'], register['id'], False)
+                    self._browse_index.append((register, bits, None))
                 
                 elif 'name' in register and 'id' in register:
                     is_bits = 'type' in register and register['type'] == 'bits'
 
                     self._init_register_value(register['name'], register['id'], influx and not is_bits)
                     self.attribute_list.append(register['name'])
+                    if isinstance(register['id'], int):
+                        self._reg_by_varname.setdefault(register['name'], register)
+                    self._browse_index.append((register, None, self._DECODERS.get(register.get('type'), Boiler._decode_raw)))
+            # variables published by fetch_data
+            self._influx_attrs = [varname for varname in self.attribute_list if self.vars[varname]['influx']]
 
 
     def _init_register_value(self, varname, id, influx):
         # this method is protected by self.lock
-        setattr(self, varname, {'name': varname, 'status': 'init', 'value': None, 'id': id, 'influx': influx})
+        self.vars[varname] = {'name': varname, 'status': 'init', 'value': None, 'id': id, 'influx': influx}
 #       {
 #           'name': varname,
 #           'value': registervalue, 
@@ -50,60 +215,17 @@ class Boiler:
 
     def _set_register_value(self, varname, registervalue):
         # this method is protected by self.lock
-        realvarname = varname if type(varname) is str else varname['name']
-        previous_value = getattr(self, realvarname, {'name': realvarname, 'status': 'init', 'value': registervalue})
-        varvalue = previous_value.copy()
-        prestatus = previous_value.get('status')
-        if prestatus == 'init':
-            status = 'read'
-        else:
-            status = prestatus
-        if status != 'init':
-            varvalue['value'] = registervalue
-            varvalue['read'] = datetime.now().isoformat()
-        varvalue['status'] = status
-        setattr(self, realvarname, varvalue)
+        varvalue = self.vars[varname]
+        if varvalue['status'] == 'init':
+            varvalue['status'] = 'read'
+        varvalue['value'] = registervalue
+        varvalue['read'] = self._poll_iso
 
     def _add_register_field(self, varname, field, value):
-        previous_value = getattr(self, varname)
-        new_value = previous_value.copy()
-        new_value[field] = value
-        setattr(self, varname, new_value)
+        self.vars[varname][field] = value
 
     def _decode_model(self, value_int: int) -> str:
-        models = {
-            0: '3-25LP',
-            1: '3-15LP',
-            2: '3-25SOLO',
-            3: '3-25K',
-            4: '3-15SOLO',
-            30: 'MC 35 E',
-            5: '3-E25LP',
-            31: 'MC 45',
-            6: 'DOMOLIGHT',
-            32: 'MC 65',
-            7: '3-35', 
-            33: 'MC 90',
-            8: '3-50',
-            34: 'C210',
-            9: '3-25 BIC',
-            35: 'C310',
-            10: '3-15ECO',
-            36: 'C610',
-            11: '3-25ECO',
-            37: 'C230',
-            12: '3-35ECO',
-            13: '3-50ECO',
-            14: '3-65ECO',
-            40: 'Robur HP',
-            20: 'Diematic 3',
-            21: 'Diematic m2',
-            22: 'Diematic m3',
-            23: 'MIT',
-            24: 'D4',
-            25: 'MB/OT interface'
-        }
-        return models.get(value_int,'Unknown')
+        return _MODEL_TABLE.get(value_int, 'Unknown')
 
     def _decode_decimal(self, value_int, decimals=0):
         if (value_int == 65535):
@@ -112,144 +234,31 @@ class Boiler:
             output = value_int & 0x7FFF
         if (value_int >> 15 == 1):
             output = -output
-        return float(output)/10**decimals
+        return float(output)/_POW10[decimals]
 
     def _encode_decimal(self, value, decimals=0):
-        decimalvalue = int(value*10**decimals)
+        decimalvalue = int(value*_POW10[decimals])
         if decimalvalue < 0:
             positivevalue = -decimalvalue
             return (positivevalue & 0x7FFF) | 0x8000
         return decimalvalue & 0x7FFF
 
     def _decode_errorcode(self, value_int):
-        if (value_int == 0x0000):
-            return 'OK'
-        if (value_int == 0x0001):
-            return 'BOILER S.FAIL.'
-        if (value_int == 0x0002):
-            return 'OUTL S.A FAIL.'
-        if (value_int == 0x0003):
-            return 'OUTL S.B FAIL.'
-        if (value_int == 0x0004):
-            return 'OUTL S.C FAIL.'
-        if (value_int == 0x0005):
-            return 'OUTSI. S.FAIL.'
-        if (value_int == 0x0006):
-            return 'SMOKE S. FAIL.'
-        if (value_int == 0x0007):
-            return 'AUX. F. DEFEKT'
-        if (value_int == 0x0009):
-            return 'DHW S. FAILURE'
-        if (value_int == 0x000A):
-            return 'BACK S.FAILURE'
-        if (value_int == 0x000B):
-            return 'ROOM S.A FAIL.'
-        if (value_int == 0x000C):
-            return 'ROOM S.B FAIL.'
-        if (value_int == 0x000D):
-            return 'ROOM S.C FAIL.'
-        if (value_int == 0x000E):
-            return 'SOLAR S. FAIL'
-        if (value_int == 0x000F):
-            return 'ST.TANK S.FAIL'
-        if (value_int == 0x0010):
-            return 'SWIM.P.A S.FAIL'
-        if (value_int == 0x0011):
-            return 'DHW 2 S. FAIL'
-        if (value_int == 0x0012):
-            return 'CDI.A COM.FAIL'
-        if (value_int == 0x0013):
-            return 'CDI.B COM.FAIL'
-        if (value_int == 0x0014):
-            return 'CDI.C COM.FAIL'
-        if (value_int == 0x001B):
-            return 'I-CURRENT FAIL'
-        if (value_int == 0x001C):
-            return 'BURNER FAILURE'
-        if (value_int == 0x001D):
-            return 'PARASIT FLAME'
-        if (value_int == 0x001E):
-            return 'STB BOILER'
-        if (value_int == 0x001F):
-            return 'STB BACK'
-        if (value_int == 0x0020):
-            return 'VALVE FAIL'
-        if (value_int == 0x0022):
-            return 'PCU BLOCKING'
-        if (value_int == 0x0023):
-            return 'EXCHAN.S.FAIL'
-        if (value_int == 0x0024):
-            return 'STB EXCHANGE'
-        if (value_int == 0x0025):
-            return 'TA-S SHORT-CIR'
-        if (value_int == 0x0026):
-            return 'TA-S DISCONNEC'
-        if (value_int == 0x0027):
-            return 'TA-S FAILURE'
-        if (value_int == 0x0028):
-            return 'MC COM.FAIL'
-        if (value_int == 0x0029):
-            return 'AUX2.SENS.FAIL'
-        if (value_int == 0x002A):
-            return 'UNIV.SENS.FAIL'
-        if (value_int == 0x002B):
-            return 'SWIM.P.B S.FAIL'
-        if (value_int == 0x002C):
-            return 'SWIM.P.C S.FAIL'
-        if (value_int == 0x002D):
-            return 'PCU COM. FAIL'
-        if (value_int == 0x002E):
-            return 'LOCKING'
-        if (value_int == 0x002F):
-            return 'PSU FAIL'
-        if (value_int == 0x0030):
-            return 'PSU PARAM FAIL'
-        if (value_int == 0x0031):
-            return 'CCE TEST FAIL'
-        if (value_int == 0x0032):
-            return 'FAN FAILURE'
-        if (value_int == 0x0033):
-            return 'SMOKE.P.FAIL'
-        if (value_int == 0x0034):
-            return 'SU COM.FAIL'
-        if (value_int == 0x0035):
-            return 'PCU-M3 COM.FAIL'
-        if (value_int == 0x0036):
-            return 'CS OPEN FAIL'
-        if (value_int == 0x0037):
-            return 'EXCH-BACK<MIN'
-        if (value_int == 0x0038):
-            return 'EXCH-BACK>MAX'
-        if (value_int == 0x0039):
-            return 'BACK>BOIL FAIL'
-        if (value_int == 0x003A):
-            return 'FAIL UNKNOWN'
-        return "Unknown error 0x{errno:x}".format(errno=value_int)
+        error = _ERRORCODE_TABLE.get(value_int)
+        if error is None:
+            error = "Unknown error 0x{errno:x}".format(errno=value_int)
+        return error
 
     def _decode_modeflag(self, value_int):
-       """ Decodes and normalizes the working mode of the boiler.
+        """ Decodes and normalizes the working mode of the boiler.
             0 -> Anti-freeze
             2 -> Night
             4 -> Day
-       """ 
-       if value_int not in (0, 2, 4):
-           return None
-       if value_int == 4:
-           return 1
-       if value_int == 2:
-           return 0
-       if value_int == 0:
-           return -1
+        """
+        return _MODEFLAG_TABLE.get(value_int)
 
     def _encode_modeflag(self, value):
-        if value not in (1,0,-1):
-            return None
-        if value == 1:
-            return 4
-        if value == 0:
-            return 2
-        if value == -1:
-            return 0
+        return _MODEFLAG_REVERSE_TABLE.get(value)
 
     def _decode_circtype(self, value_int):
         """ Decodes and normalizes the circuit type mode of the boiler.
@@ -259,35 +268,11 @@ class Boiler:
             3 -> Direct+
             4 -> 3 Way Valve+
             5 -> Swimingpool
-        """ 
-        if value_int == 0:
-           return 'DISABLE'
-        if value_int == 1:
-            return 'DIRECT'
-        if value_int == 2:
-            return '3WV'
-        if value_int == 3:
-            return 'DIRECT+'
-        if value_int == 4:
-            return '3WV+'
-        if value_int == 5:
-            return 'SWIM.'
-        return 'UNKOWN'
+        """
+        return _CIRCTYPE_TABLE.get(value_int, 'UNKOWN')
 
     def _encode_circtype(self, value):
-        if value == 'DISABLE':
-            return 0
-        if value == 'DIRECT':
-            return 1
-        if value == '3WV':
-            return 2
-        if value == 'DIRECT+':
-            return 3
-        if value == '3WV+':
-            return 4
-        if value == 'SWIM.':
-            return 5
-        return None
+        return _CIRCTYPE_REVERSE_TABLE.get(value)
 
     def _decode_program(self, value_int):
         """ Decodes program applied to circuit.
@@ -301,68 +286,76 @@ class Boiler:
     def _encode_program(self, value):
         return value - 1
 
+    def _decode_raw(self, value_int):
+        return value_int
+
+    def _decode_bits_all(self, value_int):
+        """ returns the 16 bits of the register value, bit 0 first """
+        return _BIT_LUT[value_int & 0xFF] + _BIT_LUT[value_int >> 8]
+
+    def _decode_one_decimal(self, value_int):
+        return self._decode_decimal(value_int, 1)
+
+    def _encode_one_decimal(self, value):
+        return self._encode_decimal(value, 1)
+
+    _DECODERS = {
+        'DiematicOneDecimal': _decode_one_decimal,
+        'DiematicModeFlag': _decode_modeflag,
+        'ErrorCode': _decode_errorcode,
+        'DiematicCircType': _decode_circtype,
+        'DiematicProgram': _decode_program,
+        'Model': _decode_model,
+    }
+
+    _ENCODERS = {
+        'DiematicOneDecimal': _encode_one_decimal,
+        'DiematicModeFlag': _encode_modeflag,
+        'DiematicCircType': _encode_circtype,
+        'DiematicProgram': _encode_program,
+    }
+
     def _register(self, varname):
-        for register in self.index:
-            if not isinstance(register['id'], int):
-                return
-            if register['type'] == 'bits':
-                for i in range(len(register['bits'])):
-                    bit_varname = register['bits'][i]
-                    checkname = bit_varname if type(bit_varname) is str else bit_varname['name']
-                    if checkname == varname:
-                        return register
-            else:
-                if register.get('name') == varname:
-                    return register
-        return None
+        return self._reg_by_varname.get(varname)
 
-    def _update_register(self, register):
+    def _update_register(self, register, bits=None, decoder=_decode_raw):
         # this method is protected by self.lock
         if not isinstance(register['id'], int):
             return
         register_value = self.registers[register['id']]
         if register_value is None:
-            log.debug('Browsing register id {:d} value: None'.format(register['id']))
+            log.debug('Browsing register id %d value: None', register['id'])
             return
-        log.debug('Browsing register id {:d} value: {:#04x}'.format(register['id'], register_value))
+        log.debug('Browsing register id %d value: %#04x', register['id'], register_value)
         if register['type'] == 'bits':
             if 'name' in register:
                 varname = register.get('name')
                 self._set_register_value(varname, register_value)
-            for i in range(len(register['bits'])):
-                bit_varname = register['bits'][i]
-                realvarname = bit_varname if type(bit_varname) is str else bit_varname['name']
-                if realvarname == 'io_unused':
-                    continue
-                bit_value = register_value >> i & 1
-                self._set_register_value(realvarname, bit_value)
-                if 'desc' in bit_varname:
-                    self._add_register_field(bit_varname['name'], 'desc', bit_varname['desc'])
+            self._bits_value[register['id']] = register_value & self._bit_masks[register['id']]
+            bit_values = self._decode_bits_all(register_value)
+            for i, realvarname, desc in bits:
+                self._set_register_value(realvarname, bit_values[i])
+                if desc is not None:
+                    self._add_register_field(realvarname, 'desc', desc)
         else:
             if 'name' in register:
                 varname = register.get('name')
                 if varname and varname.strip(): #test name exists
-                    if register['type'] == 'DiematicOneDecimal':
-                        self._set_register_value(varname, self._decode_decimal(register_value, 1))
-                    elif register['type'] == 'DiematicModeFlag':
-                        self._set_register_value(varname, self._decode_modeflag(register_value))
-                    elif register['type'] == 'ErrorCode':
-                        self._set_register_value(varname, self._decode_errorcode(register_value))
-                    elif register['type'] == 'DiematicCircType':
-                        self._set_register_value(varname, self._decode_circtype(register_value))
-                    elif register['type'] == 'DiematicProgram':
-                        self._set_register_value(varname, self._decode_program(register_value))
-                    elif register['type'] == 'Model':
-                        self._set_register_value(varname, self._decode_model(register_value))
-                    else:
-                        self._set_register_value(varname, register_value)
+                    self._set_register_value(varname, decoder(self, register_value))
                 if 'desc' in register:
                     self._add_register_field(varname, 'desc', register['desc'])
 
-    def browse_registers(self):
+    def browse_registers(self) -> dict[str, Any]:
+        """ 
+        Decodes the registers into the variables. Returns fetch_data() taken under the same lock.
+        """
         with self.lock:
-            for register in self.index:
-                self._update_register(register)
+            # all values of a poll share the same read time
+            self._poll_iso = datetime.now().isoformat()
+            for register, bits, decoder in self._browse_index:
+                self._update_register(register, bits, decoder)
+            self._json_bytes = None
+            return self._fetch_data()
 
     def dump_registers(self):
         output = ''
@@ -378,16 +371,27 @@ class Boiler:
         Returns a dictionary of values from the boiler. 
         """
         with self.lock:
-            output = { }
-            output['uuid'] = self.uuid
-            for varname in self.attribute_list:
-                register = getattr(self, varname)
-                if register['influx']:
-                    output[varname] = register['value']
-            return output
+            return self._fetch_data()
+
+    def _fetch_data(self) -> dict[str, Any]:
+        # this method is protected by self.lock
+        output = { }
+        output['uuid'] = self.uuid
+        for varname in self._influx_attrs:
+            output[varname] = self.vars[varname]['value']
+        return output
+
+    def json_bytes(self) -> bytes:
+        """ 
+        Returns fetch_data() serialized to JSON. The result is reused until values change.
+        """
+        with self.lock:
+            if self._json_bytes is None:
+                self._json_bytes = dumps_bytes(self._fetch_data())
+            return self._json_bytes
 
     def get_register_field(self, varname: str, field: str) -> str:
-        register = getattr(self, varname, None)
+        register = self.vars.get(varname)
         if register is None or not field in register:
             return f'No value set for field {field} in register {varname}'
         return register.get(field)
@@ -403,23 +407,24 @@ class Boiler:
 
     def set_write_pending(self, varname, newvalue, callback = None):
         with self.lock:
-            value = getattr(self, varname, None)
+            value = self.vars.get(varname)
             if value is None:
                 return
             value['newvalue'] = newvalue
             value['status'] = 'writepending'
             if callback is not None:
                 value['callback'] = callback
-            setattr(self, varname, value)
+            self._pending.append(varname)
                 
 
     def next_write(self):
         """ returns the next register that contains a pending write or None
         """
         with self.lock:
-            for varname in self.attribute_list:
-                value = getattr(self, varname, {})
-                if 'status' in value and value['status'] == 'writepending':
+            while self._pending:
+                value = self.vars[self._pending.popleft()]
+                # skip entries cleared or already taken since they were queued
+                if value['status'] == 'writepending':
                     value['status'] = 'checking'
                     return value
             return None
@@ -433,29 +438,14 @@ class Boiler:
             register = self._register(write['name'])
             encodedValue = write['newvalue']
             if register['type'] == 'bits':
-                overallvalue = 0
-                for i in range(len(register['bits'])):
-                    bit_varname = register['bits'][i]
-                    checkvarname = bit_varname if type(bit_varname) is str else bit_varname['name']
-                    if checkvarname == 'io_unused':
-                        continue
-                    if checkvarname != write['name']:
-                        bit_value = getattr(self, checkvarname)['value'] << i
-                        overallvalue = overallvalue | bit_value
-                    else:
-                        bit_value = write['newvalue'] << i
-                        overallvalue = overallvalue | bit_value
-                encodedValue = overallvalue
-            if register['type'] == 'DiematicOneDecimal':
-                encodedValue = self._encode_decimal(encodedValue, 1)
-            elif register['type'] == 'DiematicModeFlag':
-                encodedValue = self._encode_modeflag(encodedValue)
-            elif register['type'] == 'ErrorCode':
+                # unused bits are always written as 0
+                shift = self._bit_shift[write['name']]
+                encodedValue = self._bits_value[register['id']] & ~(1 << shift) | (write['newvalue'] & 1) << shift
+            if register['type'] == 'ErrorCode':
                 raise ValueError('Cannot write read only value')
-            elif register['type'] == 'DiematicCircType':
-                encodedValue = self._encode_circtype(encodedValue)
-            elif register['type'] == 'DiematicProgram':
-                encodedValue = self._encode_program(encodedValue)
+            encoder = self._ENCODERS.get(register['type'])
+            if encoder is not None:
+                encodedValue = encoder(self, encodedValue)
 
             return {
                 "address": register['id'],
@@ -465,7 +455,7 @@ class Boiler:
     def write_error(self, varname, message):
         """ The write operation failed to compare values """
         with self.lock:
-            value = getattr(self, varname, {})
+            value = self.vars[varname]
             value['error'] = message
             value['status'] = 'error'
             if 'callback' in value:
@@ -474,7 +464,7 @@ class Boiler:
     def clear_error(self, varname):
         """ clear error on varname """
         with self.lock:
-            value = getattr(self, varname, {})
+            value = self.vars[varname]
             value.pop('error', None)
             value.pop('newvalue', None)
             value['status'] = 'read'
@@ -484,11 +474,16 @@ class Boiler:
     def write_ok(self, varname):
         """ write operation succeed """
         with self.lock:
-            value = getattr(self, varname, {})
+            value = self.vars[varname]
             newvalue = value.pop('newvalue')
             value.pop('error', None)
             value['value'] = newvalue
             value['status'] = 'read'
+            self._json_bytes = None
+            shift = self._bit_shift.get(varname)
+            if shift is not None and value['id'] in self._bits_value:
+                bits_value = self._bits_value[value['id']]
+                self._bits_value[value['id']] = bits_value & ~(1 << shift) | (newvalue & 1) << shift
             if 'callback' in value:
                 value['callback']()
                 value['callback'] = None
@@ -8,24 +8,20 @@ See and respect licensing terms
 
 """
 import logging
-import json
 import yaml
 import os
 import signal
 import time
+import random
 import threading
 import argparse
 import sys
 import systemd.daemon
 
 from lockfile import pidlockfile
-from boiler import Boiler 
-from pymodbus.client.sync import ModbusSerialClient as ModbusClient
-from influxdb import InfluxDBClient
-from influxdb.exceptions import InfluxDBClientError
+from boiler import Boiler, dumps_bytes, loads_bytes
 from daemon import DaemonContext
 from daemon import pidfile
-from aiohttp import web
 from typing import Any
 
 import paho.mqtt.client as mqtt
@@ -33,8 +29,11 @@ import asyncio
 import concurrent.futures
 import ssl
 
-from webserver import DiematicWebRequestHandler
+from collections import deque
+
 from filelck import FileLock, FileLockException
+# pymodbus, influxdb, aiohttp and the web server are imported where they are used,
+# status, stop and reload don't need them and start faster
 
 """
 
@@ -76,13 +75,47 @@ logging.basicConfig(format=FORMAT, level=logging.ERROR)
 log = logging.getLogger()
 
 DEFAULT_LOGGING = 'error'
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader) # libyaml parser when PyYAML is built with it
 
 DEFAULT_MODBUS_TIMEOUT = 10
 DEFAULT_MODBUS_BAUDRATE = 9600
 DEFAULT_MODBUS_UNIT = 10
 DEFAULT_MODBUS_DEVICE = None
+DEFAULT_MODBUS_MERGE_GAP = 8 # unused registers read to join two ranges in a single request
+MODBUS_MAX_READ_COUNT = 125 # modbus limit of registers per read request
+MODBUS_RETRY_DELAY = 0.05 # first retry delay in seconds, doubles on every attempt
+MODBUS_RETRY_MAX_DELAY = 2.0
+DEFAULT_MODBUS_VERIFY_WRITES = 'readback'
+# configuration file key, expected type and DiematicApp attribute of the modbus connection settings
+MODBUS_SETTINGS = (
+    ('timeout', int, 'MODBUS_TIMEOUT'),
+    ('baudrate', int, 'MODBUS_BAUDRATE'),
+    ('unit', int, 'MODBUS_UNIT'),
+    ('device', str, 'MODBUS_DEVICE'),
+    )
+
+DEFAULT_INFLUXDB_BATCH_SIZE = 1
+DEFAULT_INFLUXDB_BATCH_AGE = 300 # seconds
+INFLUXDB_BUFFER_SIZE = 1440 # points kept while influxdb is unreachable, one day at the default loop time
+INFLUXDB_WRITE_BATCH_SIZE = 5000
+INFLUXDB_UDP_WRITE_BATCH_SIZE = 8 # points per datagram, a point takes a few KB and a datagram less than 64KB
+DEFAULT_INFLUXDB_HOST_TAG = 'raspberrypi'
+DEFAULT_INFLUXDB_TIMEOUT = 10 # seconds
+DEFAULT_INFLUXDB_GZIP = True
+
+# value formats of the readregister action, each one is called with the boiler and the register value
+READ_FORMATS = {
+    'Raw': Boiler._decode_raw,
+    **Boiler._DECODERS,
+    **{'bit{:X}'.format(bit): (lambda bit: lambda boiler, value: (value >> bit) & 1)(bit) for bit in range(16)},
+    'bits': Boiler._decode_bits_all,
+}
 
 HOMEASSISTANT_STATUS_TOPIC = 'homeassistant/status'
+MQTT_INFLIGHT_WINDOW = 32 # discovery messages sent before waiting for the oldest one
+MQTT_STATE_REFRESH_TIME = 900 # seconds, an unchanged state is published again after this time
+
+_parser = None # command-line parser, see _get_parser
 
 class DaemonRunnerError(Exception):
     """ Abstract base class for errors from DaemonRunner. """
@@ -118,23 +151,45 @@ class DiematicApp:
         self.MODBUS_DEVICE = None
         self.connection_lock = None
         self.log_modbus_errors = True
+        self.modbus_client = None
+        self.modbus_lock = threading.Lock() # serializes the poll and writer threads before taking the serial port FileLock
+        self.modbus_reads = []
+        self.registers_template = []
+        self.read_addresses = frozenset()
+        self.verify_writes = DEFAULT_MODBUS_VERIFY_WRITES
+        self.pending_verifies = deque()
 
-        self.first_run = True
         self.mqtt_loop_started = False
         self.mqtt_connected = False
         self.mqtt_connecting = False
+        self.mqtt_session = None
 
         self.force_set_offline = False
+        self.mqtt_last_state = None
+        self.mqtt_last_state_time = 0
 
+        self.cfg_key = None
         self.loop_time = 60
+        self.stop_event = threading.Event()
+        self.wakeup_event = threading.Event() # interrupts the wait between two polls
+        self.next_poll_time = 0
+        self.writes_on_main_loop = False
+
+        self.influx_client = None
+        self.influx_buffer = deque(maxlen=INFLUXDB_BUFFER_SIZE)
+        self.influx_batch_size = DEFAULT_INFLUXDB_BATCH_SIZE
+        self.influx_batch_age = DEFAULT_INFLUXDB_BATCH_AGE
+        self.influx_gzip = DEFAULT_INFLUXDB_GZIP
+        self.influx_udp_port = None
+
+        self.context = None
+        self.executor = None
 
         return
 
     def _get_context(self):
         """ Returns or create and return the self.context that is used by the surrounding daemon """
-        try:
-            return self.context
-        except AttributeError:
+        if self.context is None:
             self.context = DaemonContext(
                 pidfile=pidlockfile.PIDLockFile('/run/diematic/diematicd.pid'),
                 working_directory="/etc/diematic"
@@ -148,30 +203,58 @@ class DiematicApp:
             self.context.app = self
 
             self.pidfile_timeout = 3
-            return self.context
+        return self.context
 
     def _get_executor(self):
         """ create the executor pool or return if already created """
-        try:
-            return self.executor
-        except AttributeError:
+        if self.executor is None:
             self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-            return self.executor
+        return self.executor
+
+    def _get_modbus_client(self) -> 'ModbusClient':
+        """ Returns the modbus client, connecting it if needed. The serial
+            port is kept open between operations, call _close_modbus_client
+            to drop it after a communication error or a configuration change
+        """
+        if self.modbus_client is None:
+            from pymodbus.client.sync import ModbusSerialClient as ModbusClient
+            self.modbus_client = ModbusClient(method='rtu', port=self.MODBUS_DEVICE, timeout=self.MODBUS_TIMEOUT, baudrate=self.MODBUS_BAUDRATE)
+        if not self.modbus_client.connect():
+            from pymodbus.exceptions import ConnectionException
+            raise ConnectionException("Failed to connect[%s]" % (self.modbus_client.__str__()))
+        return self.modbus_client
+
+    def _close_modbus_client(self) -> None:
+        """ Closes the serial port, next operation will open it again """
+        if self.modbus_client is not None:
+            self.modbus_client.close()
+            self.modbus_client = None
 
     def _value_writer(self) -> None:
-        """ consumes a job writing to the boiler """
+        """ consumes the jobs writing to the boiler, the serial port is locked once to write all of them """
         write = self.MyBoiler.next_write()
+        lock_count = 0
         while not write is None and 'name' in write:
-            paramName = write['name']
-            winfo = self.MyBoiler.prepare_write(write)
-            address = winfo['address']
-            newvalue = winfo['value']
-            log.info("Pending write {register} address {address} newvalue {newvalue}".format(register=paramName, address=address, newvalue=newvalue))
-            self._internal_value_writer(paramName, address, newvalue)
-            write = self.MyBoiler.next_write()
+            try:
+                with self.modbus_lock, FileLock(self.connection_lock):
+                    while not write is None and 'name' in write:
+                        paramName = write['name']
+                        winfo = self.MyBoiler.prepare_write(write)
+                        address = winfo['address']
+                        newvalue = winfo['value']
+                        log.info("Pending write %s address %s newvalue %s", paramName, address, newvalue)
+                        self._internal_value_writer(paramName, address, newvalue)
+                        write = self.MyBoiler.next_write()
+            except FileLockException:
+                lock_count += 1
+                log.info("Can't lock the serial port")
+                if lock_count >= 6:
+                    self.MyBoiler.write_error(write['name'], "write operation failed, too many attempts to lock the serial port to write parameter {parameterName}".format(parameterName=write['name']))
+                    lock_count = 0
+                    write = self.MyBoiler.next_write()
 
     def _internal_value_writer(self, paramName: str, address: int, newvalue: int) -> None:
-        """ Writes a value to a register
+        """ Writes a value to a register, the caller holds the serial port locks
         
         :param paramName: the parameter name, used only to prepare error message if needed
         :param address: the address to write to
@@ -180,41 +263,45 @@ class DiematicApp:
         try_count = 0
         while try_count < 6:
             try:
-                with FileLock(self.connection_lock):
-                    try:
-                        client = ModbusClient(method='rtu', port=self.MODBUS_DEVICE, timeout=self.MODBUS_TIMEOUT, baudrate=self.MODBUS_BAUDRATE)
-                        with client:
-                            log.info("Going to write")
-                            rr = client.write_registers(address, newvalue, unit=self.MODBUS_UNIT)
-                            if rr.isError():
-                                log.error(rr.message)
-                                raise DiematicModbusError(rr.message)
-                            rr = client.read_holding_registers(address, unit=self.MODBUS_UNIT)
-                            if rr.isError():
-                                log.error(rr.message)
-                                raise DiematicModbusError(rr.message)
-                            receivedvalue = rr.registers[0]
-                            if not receivedvalue == newvalue:
-                                errormessage = f"write operation success, but read value differs write value {newvalue} read value {receivedvalue} address {address}"
-                                self.MyBoiler.write_error(paramName, errormessage)
-                                log.error(errormessage)
-                            else:
-                                self.MyBoiler.write_ok(paramName)
-                                log.info(f'Wite value {newvalue} at address {address} success')
-                            return
-                    except DiematicModbusError as error:
-                        try_count += 1
-                        self.MyBoiler.write_error(paramName, "write operation failed, {errormessage}".format(errormessage=error))
-                        log.info("Repeat in one second")
-                        time.sleep(1)
-                        pass
-            except FileLockException:
+                client = self._get_modbus_client()
+                log.info("Going to write")
+                rr = client.write_registers(address, newvalue, unit=self.MODBUS_UNIT)
+                if rr.isError():
+                    log.error(rr.message)
+                    raise DiematicModbusError(rr.message)
+                if self.verify_writes == 'none':
+                    self.MyBoiler.write_ok(paramName)
+                    log.info('Wite value %s at address %s done', newvalue, address)
+                elif self.verify_writes == 'fast' and self.writes_on_main_loop and address in self.read_addresses:
+                    # checked against the values of the next poll, without a poll loop the value is read back
+                    self.pending_verifies.append((paramName, address, newvalue))
+                    log.info('Wite value %s at address %s done, verify on next poll', newvalue, address)
+                else:
+                    rr = client.read_holding_registers(address, unit=self.MODBUS_UNIT)
+                    if rr.isError():
+                        log.error(rr.message)
+                        raise DiematicModbusError(rr.message)
+                    self._check_write(paramName, address, newvalue, rr.registers[0])
+                return
+            except DiematicModbusError as error:
+                self._close_modbus_client()
                 try_count += 1
-                log.info("Can't lock the serial port")
-                pass
+                self.MyBoiler.write_error(paramName, "write operation failed, {errormessage}".format(errormessage=error))
+                delay = retry_delay(try_count)
+                log.info("Repeat in %.2f seconds", delay)
+                time.sleep(delay)
 
         self.MyBoiler.write_error(paramName, "write operation failed, too many attempts to write parameter {parameterName} value {wvalue} in address {address}".format(parameterName=paramName, wvalue=newvalue, address=address))
 
+    def _check_write(self, paramName: str, address: int, newvalue: int, receivedvalue: int) -> None:
+        """ Compares the value read from a register with the value written to it """
+        if not receivedvalue == newvalue:
+            errormessage = f"write operation success, but read value differs write value {newvalue} read value {receivedvalue} address {address}"
+            self.MyBoiler.write_error(paramName, errormessage)
+            log.error(errormessage)
+        else:
+            self.MyBoiler.write_ok(paramName)
+            log.info('Wite value %s at address %s success', newvalue, address)
 
     def run(self):
         self._reload_configuration(None,None)
@@ -237,17 +324,38 @@ class DiematicApp:
 
     def main_program_loop(self) -> None:
         notified = False
-        while True:
+        self.writes_on_main_loop = True
+        while not self.stop_event.is_set():
             try:
                 if not notified and not self.args.foreground:
                     systemd.daemon.notify("READY=1")
                     notified = True
-                self.do_main_program()
+                now = time.monotonic()
+                if now >= self.next_poll_time:
+                    # fixed cadence, the time spent polling or a late wakeup does not shift the next polls
+                    self.next_poll_time += self.loop_time # a minute
+                    if self.next_poll_time <= now:
+                        self.next_poll_time = now + self.loop_time
+                    try:
+                        self.do_main_program()
+                    except Exception:
+                        # the failed poll used its whole retry time, the bus gets a pause before the next one
+                        self.next_poll_time = time.monotonic() + self.loop_time
+                        raise
             except Exception as ex:
                 log.error('Exception inside do_main_program {err}'.format(err=ex))
-            time.sleep(self.loop_time) # a minute
+            # writes queued by the web server or mqtt are done on this thread, between polls,
+            # also when the poll failed. A write queued while draining sets the event again
+            self.wakeup_event.clear()
+            try:
+                self._value_writer()
+            except Exception as ex:
+                log.error('Exception writing values {err}'.format(err=ex))
+            self.wakeup_event.wait(max(self.next_poll_time - time.monotonic(), 0))
 
     def startWebServer(self):
+        from aiohttp import web
+        from webserver import DiematicWebRequestHandler
         self._create_boiler()
 
         handler = DiematicWebRequestHandler(self.MyBoiler)
@@ -260,18 +368,17 @@ class DiematicApp:
         runner = web.AppRunner(self.webServer)
         loop.run_until_complete(runner.setup())
 
-        # argument preference is:
-        # cli takes preference over config file.
-        http = self.cfg.get('http', None)
-        hostname = self.args.hostname if self.hostname_explicit else self.args.hostname if http is None else http.get('hostname', self.args.hostname)
-        port = self.args.port if self.port_explicit else self.args.port if http is None else http.get('port', self.args.port)
-        site = web.TCPSite(runner, hostname, port)
+        site = web.TCPSite(runner, self.http_hostname, self.http_port)
         loop.run_until_complete(site.start())
         if self.args.server == 'web':
             loop.run_forever()
 
     def check_pending_writes(self):
-        self._get_executor().submit(self._value_writer)
+        if self.writes_on_main_loop:
+            self.wakeup_event.set()
+        else:
+            # web server only, there is no main loop to do the writes
+            self._get_executor().submit(self._value_writer)
 
     def _create_boiler(self):
         if self.shall_create_boiler:
@@ -280,90 +387,56 @@ class DiematicApp:
 
     def do_main_program(self):
         self._create_boiler()
-        self.shall_browse_registers = True
-        loop = True
+        deadline = time.monotonic() + self.loop_time
         count = 0
-        while loop:
+        while True:
             try:
                 self.run_sync_client()
-                loop = False
+                return
             except DiematicModbusError as e:
                 count += 1
-                if count > self.loop_time:
+                if time.monotonic() >= deadline:
                     raise e
-                time.sleep(1)
-                pass
-        return
+                time.sleep(retry_delay(count))
 
     def run_sync_client(self):
-        #enabling modbus communication
-        if self.first_run:
-            log.info("Connection parameters: device={port!r} timeout={timeout!r} baudrate={baudrate!r}".format(port=self.MODBUS_DEVICE, timeout=self.MODBUS_TIMEOUT, baudrate=self.MODBUS_BAUDRATE))
-            self.log_modbus_errors = True
-            self.first_run = False
-        else:
-            self.log_modbus_errors = False
         try:
-            with FileLock(self.connection_lock):
-                client = ModbusClient(method='rtu', port=self.MODBUS_DEVICE, timeout=self.MODBUS_TIMEOUT, baudrate=self.MODBUS_BAUDRATE)
-                with client:
-                    self.MyBoiler.registers = []
-                    id_stop = -1
-
-                    for mbrange in self.cfg['modbus']['register_ranges']:
-                        id_start = mbrange[0]
-                        self.MyBoiler.registers.extend([None] * (id_start-id_stop-1))
-                        id_stop = mbrange[1]
-
-                        log.debug("Attempt to read registers from {} to {}".format(id_start, id_stop))
-                        rr = client.read_holding_registers(count=(id_stop-id_start+1), address=id_start, unit=self.MODBUS_UNIT)
-                        if rr.isError():
-                            if self.log_modbus_errors:
-                                log.error(rr.message)
-                            raise DiematicModbusError(rr.message)
-                            # MyBoiler.registers.extend([None] * (id_stop-id_start+1))
-                        else:
-                            self.MyBoiler.registers.extend(rr.registers)
-        except FileLockException:
-            log.warning("Can't adquire the lock on the serial port")
+            result = self._read_registers()
+        finally:
+            # only the errors of the first poll after loading the configuration are logged
+            self.log_modbus_errors = False
+        if result is None:
             return
+        registers, verifies = result
 
         #parsing registers to push data in Object attributes
-        self.MyBoiler.browse_registers()
-        data = self.MyBoiler.fetch_data()
+        self.MyBoiler.registers = registers
+        data = self.MyBoiler.browse_registers()
+        for paramName, address, newvalue in verifies:
+            # skip writes requested again since, the new request will be verified by itself
+            if self.MyBoiler.get_register_field(paramName, 'status') == 'checking':
+                self._check_write(paramName, address, newvalue, registers[address])
+        if verifies:
+            # a checked write sets the value it wrote
+            data = self.MyBoiler.fetch_data()
         log.info("Values read")
-        log.debug("Dumping values\n" + self.MyBoiler.dump())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Dumping values\n" + self.MyBoiler.dump())
 
         #pushing data to influxdb
         if self.args.backend and (self.args.backend == 'influxdb' or (self.args.backend == 'configured' and 'influxdb' in self.cfg)):
-            timestamp = int(time.time() * 1000) #milliseconds
-            influx_json_body = [{
-                "measurement": "diematic",
-                "tags": {
-                    "host": "raspberrypi",
-                },
-                "timestamp": timestamp,
-                "fields": data
-            }]
-
-            influxcfg = self.cfg.get('influxdb', None)
-            influx_host = self.args.influxdb_host if self.influxdb_host_explicit else influxcfg.get('host', None) if influxcfg is not None else None
-            influx_port = self.args.influxdb_port if self.influxdb_port_explicit else influxcfg.get('port', None) if influxcfg is not None else None
-            influx_user = self.args.influxdb_user if self.influxdb_user_explicit else influxcfg.get('user', None) if influxcfg is not None else None
-            influx_password = self.args.influxdb_password if self.influxdb_password_explicit else influxcfg.get('password', None) if influxcfg is not None else None
-            influx_database = self.args.influxdb_database if self.influxdb_database_explicit else influxcfg.get('database', None) if influxcfg is not None else None
-
-            if influx_host is not None and influx_port is not None and influx_user is not None and influx_password is not None and influx_database is not None:
-                influx_client = InfluxDBClient(influx_host, influx_port, influx_user, influx_password, influx_database)
-
-                log.debug("Write points: {0}".format(influx_json_body))
-                try:
-                    influx_client.write_points(influx_json_body, time_precision='ms')
-                    log.info("Values written to influxdb")
-                except InfluxDBClientError as e:
-                    log.error(e)
-                except Exception as e:
-                    log.error(e)
+            influx_client = self._get_influx_client()
+            if influx_client is not None:
+                timestamp = int(time.time() * 1000) #milliseconds
+                from influxdb.line_protocol import make_line
+                # encoded once, buffered points are not converted again on every retry
+                # the udp listener of influxdb has no precision parameter, its default is nanoseconds
+                line_time = timestamp * 1000000 if self.influx_udp_port else timestamp
+                line = make_line("diematic", tags=self.influx_tags, fields=data, time=line_time)
+                self.influx_buffer.append((timestamp, line))
+                oldest = self.influx_buffer[0][0]
+                if len(self.influx_buffer) >= self.influx_batch_size or timestamp - oldest >= self.influx_batch_age * 1000:
+                    self._flush_influx(influx_client)
             else:
                 log.error(f'influxdb backend is missconfigured, please review configuration file and/or arguments')
         
@@ -371,11 +444,14 @@ class DiematicApp:
             try:
                 if self.mqtt_inform_available:
                     log.info('Sending online message to mqtt')
+                    # (re)connected or home assistant restarted, the state must be sent again
+                    self.mqtt_last_state = None
+                    # same qos and retain as the will, otherwise a retained 'offline' from the will outlives this message
                     if self.force_set_offline:
-                        self.mqttc.publish(topic=self.mqtt_topic_available, payload='offline', qos=0, retain=self.mqtt_retain).wait_for_publish()
+                        self.mqttc.publish(topic=self.mqtt_topic_available, payload='offline', qos=1, retain=True)
                         self.force_set_offline = False
                     else:
-                        self.mqttc.publish(topic=self.mqtt_topic_available, payload='online', qos=0, retain=self.mqtt_retain).wait_for_publish()
+                        self.mqttc.publish(topic=self.mqtt_topic_available, payload='online', qos=1, retain=True)
                         self.mqtt_inform_available = False
 
                 if self.ha_discovery and self.shall_run_discovery:
@@ -383,40 +459,134 @@ class DiematicApp:
                     self.shall_run_discovery = False
                     log.info('Sending discovery info')
                     time.sleep(0.3)
-                mqtt_json_body = json.dumps(data, indent=2)
-                self.mqttc.publish(topic=self.mqtt_topic, payload=mqtt_json_body, qos=0, retain=self.mqtt_retain).wait_for_publish()
-                log.info('Values published to mqtt')
+                # shared with the /diematic/json responses
+                mqtt_json_body = self.MyBoiler.json_bytes()
+                now = time.monotonic()
+                if mqtt_json_body != self.mqtt_last_state or now - self.mqtt_last_state_time >= MQTT_STATE_REFRESH_TIME:
+                    self.mqttc.publish(topic=self.mqtt_topic, payload=mqtt_json_body, qos=0, retain=self.mqtt_retain)
+                    self.mqtt_last_state = mqtt_json_body
+                    self.mqtt_last_state_time = now
+                    log.info('Values published to mqtt')
+                else:
+                    log.debug('Values unchanged, not published to mqtt')
             except RuntimeError as e:
                 log.error('Can\'t publish due to RuntimeError: {err}'.format(err=e))
             except ValueError as e:
                 log.error('Can\'t publish due to ValueError: {err}'.format(err=e))
 
+    def _read_registers(self) -> list:
+        """ Reads all the configured register ranges from the boiler. Only the
+            serial port access is done while holding the locks
+
+            :return: a tuple with the list of register values indexed by register
+                id and the writes to verify with them, or ``None`` when the
+                serial port can't be locked
+        """
+        try:
+            with self.modbus_lock, FileLock(self.connection_lock):
+                client = self._get_modbus_client()
+                try:
+                    registers = self.registers_template[:]
+                    for read_start, read_stop, mbranges in self.modbus_reads:
+                        log.debug("Attempt to read registers from %s to %s", read_start, read_stop)
+                        rr = client.read_holding_registers(count=(read_stop-read_start+1), address=read_start, unit=self.MODBUS_UNIT)
+                        if rr.isError():
+                            if self.log_modbus_errors:
+                                log.error(rr.message)
+                            raise DiematicModbusError(rr.message)
+                        for id_start, id_stop in mbranges:
+                            registers[id_start:id_stop+1] = rr.registers[id_start-read_start:id_stop-read_start+1]
+                    # writes done before this poll took the lock, the values just read include them
+                    verifies = [self.pending_verifies.popleft() for _ in range(len(self.pending_verifies))]
+                    return (registers, verifies)
+                except Exception:
+                    self._close_modbus_client()
+                    raise
+        except FileLockException:
+            log.warning("Can't adquire the lock on the serial port")
+            return None
+
+    def _get_influx_client(self) -> 'InfluxDBClient':
+        """ Returns the InfluxDB client, it is created on first use after each configuration load.
+            Returns None when connection parameters are missing
+        """
+        if self.influx_client is None:
+            influx_params = (self.influx_host, self.influx_port, self.influx_user, self.influx_password, self.influx_database)
+            if self.influx_udp_port and self.influx_host is not None:
+                from influxdb import InfluxDBClient
+                # points go as datagrams to the database of the server udp listener, nothing is answered
+                self.influx_client = InfluxDBClient(self.influx_host, use_udp=True, udp_port=self.influx_udp_port)
+            elif None not in influx_params:
+                from influxdb import InfluxDBClient
+                # a single connection kept alive, only the main loop writes points
+                self.influx_client = InfluxDBClient(*influx_params, timeout=self.influx_timeout, pool_size=1, gzip=self.influx_gzip)
+        return self.influx_client
+
+    def _flush_influx(self, influx_client: 'InfluxDBClient') -> None:
+        """ Writes all buffered points to influxdb in a single request.
+            Points are kept for the next attempt when the database can't be reached
+        """
+        from influxdb.exceptions import InfluxDBClientError
+        points = [line for _, line in self.influx_buffer]
+        log.debug("Write points: %s", points)
+        try:
+            if self.influx_udp_port:
+                influx_client.write_points(points, batch_size=INFLUXDB_UDP_WRITE_BATCH_SIZE, protocol='line')
+            else:
+                influx_client.write_points(points, time_precision='ms', batch_size=INFLUXDB_WRITE_BATCH_SIZE, protocol='line')
+            self.influx_buffer.clear()
+            log.info("Values written to influxdb")
+        except InfluxDBClientError as e:
+            # the database rejected the points, sending them again won't help
+            self.influx_buffer.clear()
+            log.error(e)
+        except Exception as e:
+            log.error(e)
+
     def _mqtt_device_keys(self) -> tuple[str, str]:
         """
         Returns a tuple that contains device prefix and uuid
         """
-        prefix = self.args.mqtt_ha_discovery_prefix 
-        if not self.mqtt_ha_discovery_prefix_explicit and 'mqtt' in self.cfg and 'discovery' in self.cfg['mqtt'] and 'prefix' in self.cfg['mqtt']['discovery']:
-            confkey = self.cfg['mqtt']['discovery']
-            prefix = confkey.get('prefix','homeassistant')
-        uuid = self.cfg['boiler']['uuid'].replace('-','')
-        return [prefix, uuid]
+        return (self.mqtt_ha_prefix, self.mqtt_uuid)
 
     def _mqtt_topic_header(self, component: str, object_id: str) -> str:
-        prefix, uuid = self._mqtt_device_keys()
-        return f'{prefix}/{component}/{uuid}/{object_id}'
+        return f'{self.mqtt_ha_prefix}/{component}/{self.mqtt_uuid}/{object_id}'
 
     def home_assistant_discovery(self, data: dict[str, Any]) -> None:
         # --------------------------------------------------------------------------- #
         # send home assistant discovery information
         # --------------------------------------------------------------------------- #
-        log.debug('preparing discovery for sensors')
-        prefix, uuid = self._mqtt_device_keys()
-        device_name = self.cfg['boiler'].get('name', 'Boiler')
         model = data.get('boiler_model', 'Unknown')
         sw_version = str(data.get('software_version', 0))
         qos = 0
+        if self.ha_discovery_cache is None or self.ha_discovery_cache[0] != (model, sw_version):
+            self.ha_discovery_cache = ((model, sw_version), self.ha_discovery_messages(model, sw_version))
+
+        inflight = deque()
+        for object_id, topic, payload, command_topic in self.ha_discovery_cache[1]:
+            if command_topic is not None:
+                # subscribe to this topic
+                self.mqttc.subscribe(command_topic, 2)
+            inflight.append(self.mqttc.publish(topic=topic, payload=payload, qos=qos, retain=self.mqtt_retain))
+            log.info('Entity %s discovered via mqtt', object_id)
+            if len(inflight) >= MQTT_INFLIGHT_WINDOW:
+                inflight.popleft().wait_for_publish()
+
+        while inflight:
+            inflight.popleft().wait_for_publish()
+
+    def ha_discovery_messages(self, model: str, sw_version: str) -> list[tuple[str, str, bytes, str]]:
+        """ Prepare the discovery messages of all entities. They only depend on the
+            configuration and on the boiler model and version, so they are kept in
+            self.ha_discovery_cache until the configuration is reloaded
+
+            :return: a list of (object_id, topic, payload, command_topic) tuples
+        """
+        log.debug('preparing discovery for sensors')
+        prefix, uuid = self._mqtt_device_keys()
+        device_name = self.cfg['boiler'].get('name', 'Boiler')
         subtopic = self.mqtt_topic.split('/').pop()
+        messages = []
         for register in self.MyBoiler.index:
             if not 'component' in register:
                 continue
@@ -444,24 +614,24 @@ class DiematicApp:
             command_template = register.get('command_template', None)
             options = register.get('options', None)
             suggested_display_precision = register.get('suggested_display_precision', None)
-            self.ha_discover(
-                prefix, uuid, model, sw_version, qos, subtopic, device_name,
+            messages.append(self.ha_discover(
+                prefix, uuid, model, sw_version, subtopic, device_name,
                 component=component, object_id=object_id, entity_category=entity_category, 
                 icon=icon,
                 device_class=device_class, state_class=state_class, 
                 unit=unit, min=min, max=max, step=step, value_template=value_template, 
                 command_template=command_template, options=options,
                 suggested_display_precision=suggested_display_precision
-            )
+            ))
         
         bitstypes = [b for x in self.MyBoiler.index if x.get('type', None) == 'bits' and x.get('bits', None) is not None for b in x['bits'] ]
         for bit in bitstypes:
             if type(bit) is dict:
-                self.ha_discover(
-                    prefix, uuid, model, sw_version, qos, subtopic, device_name,
+                messages.append(self.ha_discover(
+                    prefix, uuid, model, sw_version, subtopic, device_name,
                     component='binary_sensor', object_id=bit['name'], 
                     entity_category='diagnostic', icon='mdi:pump', payload_on='1', payload_off='0'
-                )
+                ))
         
         # for circuit in ("a", "b", "c"):
         #     if f"monday_{circuit}_0000_0030" in bitstypes:
@@ -470,16 +640,18 @@ class DiematicApp:
         #             component='binary_sensor', object_id=f"io_circ_{circuit}_pump_on", 
         #             entity_category='diagnostic', icon='mdi:pump', payload_on='1', payload_off='0'
         #         )
+        return messages
 
 
     def ha_discover(self, prefix:str, uuid:str, model: str, sw_version: str,
-        qos: int, subtopic: str, device_name: str, component: str, object_id: str, 
+        subtopic: str, device_name: str, component: str, object_id: str, 
         entity_category: str, icon: str, device_class: str = None, state_class: str = None, 
         unit: str = None, min: float = None, max: float = None, step: float = None, 
         value_template: str = None, command_template: str = None,
         options: list[str] = None, suggested_display_precision: int = None,
         payload_on: str = None, payload_off: str = None
-    ):
+    ) -> tuple[str, str, bytes, str]:
+        """ Prepare the discovery message of one entity, see ha_discovery_messages """
         entity_name = self.MyBoiler.get_register_field(object_id, 'desc')
         topic_head = f'{prefix}/{component}/{uuid}/{object_id}'
         topic = f'{topic_head}/config'
@@ -537,8 +709,9 @@ class DiematicApp:
 
         # if component == 'sensor':
         #     config["state_class"] = f"{state_class}"
+        command_topic = None
         if component == 'number' or component == 'select':
-            self.command_topic(topic_head, object_id, config)
+            command_topic = self.command_topic(topic_head, object_id, config)
         if component == 'sensor':
             config['platform'] = 'sensor'
         if component == 'binary_sensor':
@@ -548,15 +721,13 @@ class DiematicApp:
         if payload_off is not None:
             config['payload_off'] = payload_off
         
-        config_str = json.dumps(config, indent=2)
-        self.mqttc.publish(topic=topic, payload=config_str, qos=qos, retain=self.mqtt_retain).wait_for_publish()
-        log.info(f'Entity {object_id} discovered via mqtt')
+        config_str = dumps_bytes(config)
+        return (object_id, topic, config_str, command_topic)
 
-    def command_topic(self, topic_head: str, object_id: str, config: dict[str, Any]):
+    def command_topic(self, topic_head: str, object_id: str, config: dict[str, Any]) -> str:
         command_topic = f"{topic_head}/set/{object_id}"
         config["command_topic"] = command_topic
-        # subscribe to this topic
-        self.mqttc.subscribe(command_topic, 2)
+        return command_topic
 
     def read_config_file(self):
         # --------------------------------------------------------------------------- #
@@ -567,12 +738,19 @@ class DiematicApp:
         else:
             main_base = os.path.dirname(__file__)
             config_file = os.path.join(main_base, self.args.config)
-        if not os.path.exists(config_file):
+        try:
+            st = os.stat(config_file)
+        except FileNotFoundError:
             errmsg = "Configuration file not found {file!r}".format(file=config_file)
             raise FileNotFoundError(errmsg)
-        with open(config_file) as f:
-            # use safe_load instead load
-            self.cfg = yaml.safe_load(f)
+        cfg_key = (config_file, st.st_mtime_ns, st.st_size)
+        if cfg_key == self.cfg_key:
+            # file not changed since the last load
+            return
+        with open(config_file, 'rb') as f:
+            # safe loader only, never construct arbitrary objects
+            self.cfg = yaml.load(f, Loader=YAML_LOADER)
+        self.cfg_key = cfg_key
 
     def toJSON(self):
         """Return the configuration file in json format"""
@@ -606,9 +784,10 @@ class DiematicApp:
         self.stdout_path = os.path.join(os.sep, "var", "log", "diematic", "diematic.out") # Can also be /dev/null 
         self.stderr_path =  os.path.join(os.sep, "var", "log", "diematic", "diematic.err") # Can also be /dev/null
 
-        self._get_context().stdin = open(self.stdin_path, 'rt')
-        self._get_context().stdout = open(self.stdout_path, 'w+t')
-        self._get_context().stderr = open(self.stderr_path, 'w+t')
+        context = self._get_context()
+        context.stdin = open(self.stdin_path, 'rt')
+        context.stdout = open(self.stdout_path, 'w+t')
+        context.stderr = open(self.stderr_path, 'w+t')
 
     def _start(self):
         """ Open the daemon context and run the application.
@@ -617,17 +796,19 @@ class DiematicApp:
             :raises DaemonRunnerStartFailureError: If the PID file cannot
                 be locked by this process.
             """
-        if is_pidfile_stale(self._get_context().pidfile):
-            self._get_context().pidfile.break_lock()
-        elif self.args.server == 'both' and is_process_already_running(self._get_context().pidfile):
+        context = self._get_context()
+        pid, running, stale = probe_pidfile(context.pidfile)
+        if stale:
+            context.pidfile.break_lock()
+        elif self.args.server == 'both' and running:
             error = DaemonRunnerStartFailureError(
-                "Process already running {pid:d}".format(pid=self._get_context().pidfile.read_pid()))
+                "Process already running {pid:d}".format(pid=pid))
             raise error
 
         if self.args.server == 'both' and not self.args.foreground:
             try:
                 self._open_streams_from_app_stream_paths()
-                with self._get_context():
+                with context:
                     pid = os.getpid()
                     message = self.start_message.format(pid=pid)
                     emit_message(message, sys.stdout)
@@ -635,7 +816,7 @@ class DiematicApp:
             except pidlockfile.AlreadyLocked as exc:
                 error = DaemonRunnerStartFailureError(
                         "PID file {pidfile.path!r} already locked".format(
-                            pidfile=self._get_context().pidfile))
+                            pidfile=context.pidfile))
                 raise error from exc
         else:
             self.run()
@@ -656,80 +837,34 @@ class DiematicApp:
             value. Does not need to exist in the yaml file
         """
         address = self.args.address
-        format = self.args.format
+        decode = READ_FORMATS[self.args.format]
         self._reload_configuration(None,None)
         self._create_boiler()
         tryCount = 0
         try:
-            with FileLock(self.connection_lock):
-                while tryCount < 5:
-                    registers = []
-                    tryCount += 1
+            while tryCount < 5:
+                tryCount += 1
+                with self.modbus_lock, FileLock(self.connection_lock):
                     try:
-                        client = ModbusClient(method='rtu', port=self.MODBUS_DEVICE, timeout=self.MODBUS_TIMEOUT, baudrate=self.MODBUS_BAUDRATE)
-                        with client:
-                            registers.extend([None] * (-1))
-                            log.debug("Attempt to read register {}".format(address))
-                            rr = client.read_holding_registers(count=1, address=address, unit=self.MODBUS_UNIT)
-                            if rr.isError():
-                                log.error(rr.message)
-                                raise DiematicModbusError(rr.message)
-                            else:
-                                registers.extend(rr.registers)
-                                # format output
-                                if format == 'Raw':
-                                    emit_message("Register {} value {}".format(address, registers[0]), sys.stdout)
-                                elif format == 'DiematicOneDecimal':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_decimal(registers[0], 1)), sys.stdout)
-                                elif format == 'DiematicModeFlag':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_modeflag(registers[0])), sys.stdout)
-                                elif format == 'ErrorCode':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_errorcode(registers[0])), sys.stdout)
-                                elif format == 'DiematicCircType':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_circtype(registers[0])), sys.stdout)
-                                elif format == 'DiematicProgram':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_program(registers[0])), sys.stdout)
-                                elif format == 'Model':
-                                    emit_message("Register {} value {}".format(address, self.MyBoiler._decode_model(registers[0])), sys.stdout)
-                                elif format == 'bit0':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0001) >> 0), sys.stdout)
-                                elif format == 'bit1':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0002) >> 1), sys.stdout)
-                                elif format == 'bit2':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0004) >> 2), sys.stdout)
-                                elif format == 'bit3':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0008) >> 3), sys.stdout)
-                                elif format == 'bit4':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0010) >> 4), sys.stdout)
-                                elif format == 'bit5':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0020) >> 5), sys.stdout)
-                                elif format == 'bit6':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0040) >> 6), sys.stdout)
-                                elif format == 'bit7':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0080) >> 7), sys.stdout)
-                                elif format == 'bit8':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0100) >> 8), sys.stdout)
-                                elif format == 'bit9':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0200) >> 9), sys.stdout)
-                                elif format == 'bitA':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0400) >> 10), sys.stdout)
-                                elif format == 'bitB':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x0800) >> 11), sys.stdout)
-                                elif format == 'bitC':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x1000) >> 12), sys.stdout)
-                                elif format == 'bitD':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x2000) >> 13), sys.stdout)
-                                elif format == 'bitE':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x4000) >> 14), sys.stdout)
-                                elif format == 'bitF':
-                                    emit_message("Register {} value {}".format(address, (registers[0] & 0x8000) >> 15), sys.stdout)
-                                tryCount = 99 # exit while
+                        client = self._get_modbus_client()
+                        log.debug("Attempt to read register %s", address)
+                        rr = client.read_holding_registers(count=1, address=address, unit=self.MODBUS_UNIT)
+                        if rr.isError():
+                            log.error(rr.message)
+                            raise DiematicModbusError(rr.message)
+                        # format output
+                        emit_message(f"Register {address} value {decode(self.MyBoiler, rr.registers[0])}", sys.stdout)
+                        break
                     except DiematicModbusError:
-                        time.sleep(1)
-                        pass
+                        self._close_modbus_client()
+                # the serial port is released while waiting for the next attempt
+                if tryCount < 5:
+                    time.sleep(retry_delay(tryCount))
         except FileLockException:
             log.warning("Can't adquire the lock file on the serial port")
             pass
+        finally:
+            self._close_modbus_client()
 
     def _terminate_daemon_process(self, _signal, _stack):
         """ Terminate the daemon process specified in the current PID file.
@@ -742,6 +877,8 @@ class DiematicApp:
         pid = self._get_context().pidfile.read_pid()
         ownpid = os.getpid()
         if pid == ownpid:
+            self.stop_event.set()
+            self.wakeup_event.set()
             sys.exit(2)
         try:
             os.kill(pid, signal.SIGTERM)
@@ -758,22 +895,25 @@ class DiematicApp:
             :raises DaemonRunnerStopFailureError: If the PID file is not
                 already locked.
             """
-        if not self._get_context().pidfile.is_locked():
+        pidfile = self._get_context().pidfile
+        if not pidfile.is_locked():
             error = DaemonRunnerStopFailureError(
                     "PID file {pidfile.path!r} not locked".format(
-                        pidfile=self._get_context().pidfile))
+                        pidfile=pidfile))
             raise error
 
-        if is_pidfile_stale(self._get_context().pidfile):
-            self._get_context().pidfile.break_lock()
+        pid, running, stale = probe_pidfile(pidfile)
+        if stale:
+            pidfile.break_lock()
         else:
             self._terminate_daemon_process(None, None)
 
     def _status(self):
-        if is_process_already_running(self._get_context().pidfile):
-            message = "Process is running on pid {pid:d}".format(pid=self._get_context().pidfile.read_pid())
+        pid, running, stale = probe_pidfile(self._get_context().pidfile)
+        if running:
+            message = "Process is running on pid {pid:d}".format(pid=pid)
             emit_message(message, sys.stdout)
-        elif is_pidfile_stale(self._get_context().pidfile):
+        elif stale:
             message = "Process is NOT running but a pid file exists"
             emit_message(message, sys.stdout)
         else:
@@ -782,66 +922,126 @@ class DiematicApp:
 
     def _reload(self):
         """ Send a SIGUSR1 to the running process so it is forced to reload configuration file."""
-        if not self._get_context().pidfile.is_locked():
+        pidfile = self._get_context().pidfile
+        if not pidfile.is_locked():
             error = DaemonRunnerReloadFailureError(
                 "PID file {pidfile.path!r} not locked".format(
-                    pidfile=self._get_context().pidfile))
+                    pidfile=pidfile))
             raise error
-        if is_pidfile_stale(self._get_context().pidfile):
-            self._get_context().pidfile.break_lock()
+        pid, running, stale = probe_pidfile(pidfile)
+        if stale:
+            pidfile.break_lock()
         else:
-            pid = self._get_context().pidfile.read_pid()
             os.kill(pid, signal.SIGUSR1)
 
     def _reload_configuration(self, _signal, _stack):
         """ Reload the configuration from the configuration file."""
         log.info("Reloading configuration")
-        if self.args.device:
-            self.MODBUS_DEVICE = self.args.device
-            self.connection_lock = self.MODBUS_DEVICE[self.MODBUS_DEVICE.rindex('/')+1:]
-
         self.read_config_file()
         self.set_logging_level()
-        if 'modbus' in self.cfg:
-            if isinstance(self.cfg['modbus']['timeout'], int):
-                self.MODBUS_TIMEOUT = self.cfg['modbus']['timeout']
-            if isinstance(self.cfg['modbus']['baudrate'], int):
-                self.MODBUS_BAUDRATE = self.cfg['modbus']['baudrate']
-            if isinstance(self.cfg['modbus']['unit'], int):
-                self.MODBUS_UNIT = self.cfg['modbus']['unit']
-            if isinstance(self.cfg['modbus']['device'], str):
-                self.MODBUS_DEVICE = self.cfg['modbus']['device']
-                self.connection_lock = self.MODBUS_DEVICE[self.MODBUS_DEVICE.rindex('/')+1:]
-        if self.MODBUS_TIMEOUT is None:
-            self.MODBUS_TIMEOUT = DEFAULT_MODBUS_TIMEOUT
-        if self.MODBUS_BAUDRATE is None:
-            self.MODBUS_BAUDRATE = DEFAULT_MODBUS_BAUDRATE
-        if self.MODBUS_UNIT is None:
-            self.MODBUS_UNIT = DEFAULT_MODBUS_UNIT
+        modbuscfg = self.cfg.get('modbus') or {}
+        settings = {attr: getattr(self, attr) for _, _, attr in MODBUS_SETTINGS}
+        if self.args.device:
+            settings['MODBUS_DEVICE'] = self.args.device
+        for key, keytype, attr in MODBUS_SETTINGS:
+            value = modbuscfg.get(key)
+            if isinstance(value, keytype):
+                settings[attr] = value
+        if settings['MODBUS_TIMEOUT'] is None:
+            settings['MODBUS_TIMEOUT'] = DEFAULT_MODBUS_TIMEOUT
+        if settings['MODBUS_BAUDRATE'] is None:
+            settings['MODBUS_BAUDRATE'] = DEFAULT_MODBUS_BAUDRATE
+        if settings['MODBUS_UNIT'] is None:
+            settings['MODBUS_UNIT'] = DEFAULT_MODBUS_UNIT
+        if 'register_ranges' in modbuscfg:
+            merge_gap = modbuscfg.get('merge_gap', DEFAULT_MODBUS_MERGE_GAP)
+            if modbuscfg.get('bulk_read', False):
+                # any gap that fits in a read request is read, only the request size limit splits the reads
+                merge_gap = MODBUS_MAX_READ_COUNT
+            modbus_reads = merge_register_ranges(modbuscfg['register_ranges'], merge_gap)
+        else:
+            modbus_reads = []
+        verify_writes = self._resolve(None, False, 'modbus', 'verify_writes', DEFAULT_MODBUS_VERIFY_WRITES)
+        if not verify_writes in ('readback', 'fast', 'none'):
+            raise ValueError(f'Invalid modbus verify_writes value {verify_writes!r}')
 
         # --------------------------------------------------------------------------- #
         # check mandatory configuration variables
         # --------------------------------------------------------------------------- #
-        if self.MODBUS_DEVICE is None:
+        if settings['MODBUS_DEVICE'] is None:
             raise ValueError('Modbus device not set')
+
+        # the poll and writer threads may be using the serial port, the new
+        # settings replace the old ones between two of their operations
+        with self.modbus_lock:
+            for attr, value in settings.items():
+                setattr(self, attr, value)
+            self.modbus_reads = modbus_reads
+            # registers not included in a range stay None
+            self.registers_template = [None] * (modbus_reads[-1][1] + 1) if modbus_reads else []
+            self.read_addresses = frozenset(id for _, _, mbranges in modbus_reads for id_start, id_stop in mbranges for id in range(id_start, id_stop + 1))
+            self.verify_writes = verify_writes
+            self.connection_lock = os.path.basename(self.MODBUS_DEVICE)
+            self._close_modbus_client()
+            self.pending_verifies.clear()
+            self.log_modbus_errors = True
+        log.info("Connection parameters: device=%r timeout=%r baudrate=%r", self.MODBUS_DEVICE, self.MODBUS_TIMEOUT, self.MODBUS_BAUDRATE)
         self.shall_create_boiler = True
         self.mqtt_started = False
 
-        mqttk = self.cfg.get('mqtt', None)
-        self.ha_discovery = self.args.mqtt_ha_discovery if self.mqtt_ha_discovery_explicit else mqttk.get('discovery', False) if mqttk is not None else False
-        self.shall_run_discovery = True if self.ha_discovery is not None else False
-        self.mqtt_topic = self.args.mqtt_topic if self.mqtt_topic_explicit else mqttk.get('topic', 'diematic2mqtt/boiler') if mqttk is not None else 'diematic2mqtt/boiler'
+        # argument preference is:
+        # cli takes preference over config file.
+        self.http_hostname = self._resolve(self.args.hostname, self.hostname_explicit, 'http', 'hostname', self.args.hostname)
+        self.http_port = self._resolve(self.args.port, self.port_explicit, 'http', 'port', self.args.port)
+
+        self.influx_client = None
+        self.influx_host = self._resolve(self.args.influxdb_host, self.influxdb_host_explicit, 'influxdb', 'host')
+        self.influx_port = self._resolve(self.args.influxdb_port, self.influxdb_port_explicit, 'influxdb', 'port')
+        self.influx_user = self._resolve(self.args.influxdb_user, self.influxdb_user_explicit, 'influxdb', 'user')
+        self.influx_password = self._resolve(self.args.influxdb_password, self.influxdb_password_explicit, 'influxdb', 'password')
+        self.influx_database = self._resolve(self.args.influxdb_database, self.influxdb_database_explicit, 'influxdb', 'database')
+        self.influx_batch_size = self._resolve(None, False, 'influxdb', 'batch_size', DEFAULT_INFLUXDB_BATCH_SIZE)
+        self.influx_batch_age = self._resolve(None, False, 'influxdb', 'batch_age', DEFAULT_INFLUXDB_BATCH_AGE)
+        self.influx_timeout = self._resolve(None, False, 'influxdb', 'timeout', DEFAULT_INFLUXDB_TIMEOUT)
+        self.influx_gzip = bool(self._resolve(None, False, 'influxdb', 'gzip', DEFAULT_INFLUXDB_GZIP))
+        self.influx_udp_port = self._resolve(None, False, 'influxdb', 'udp_port')
+        self.influx_tags = {"host": self._resolve(None, False, 'influxdb', 'host_tag', DEFAULT_INFLUXDB_HOST_TAG)}
+
+        self.ha_discovery = self._resolve(self.args.mqtt_ha_discovery, self.mqtt_ha_discovery_explicit, 'mqtt', 'discovery', False)
+        self.shall_run_discovery = self.ha_discovery is not None
+        self.ha_discovery_cache = None
+        self.mqtt_topic = self._resolve(self.args.mqtt_topic, self.mqtt_topic_explicit, 'mqtt', 'topic', 'diematic2mqtt/boiler')
         self.mqtt_topic_available = f'{self.mqtt_topic}/availability'
-
-        self.mqtt_retain = False
-        if self.mqtt_retain_explicit:
-            self.mqtt_retain = self.args.mqtt_retain
-        elif 'mqtt' in self.cfg and 'retain' in self.cfg['mqtt']:
-            self.mqtt_retain = self.cfg['mqtt'].get('retain')
+        self.mqtt_retain = self._resolve(self.args.mqtt_retain, self.mqtt_retain_explicit, 'mqtt', 'retain', False)
+        self.mqtt_ha_prefix = self.args.mqtt_ha_discovery_prefix
+        discoverycfg = self._resolve(None, False, 'mqtt', 'discovery')
+        if not self.mqtt_ha_discovery_prefix_explicit and isinstance(discoverycfg, dict) and 'prefix' in discoverycfg:
+            self.mqtt_ha_prefix = discoverycfg.get('prefix','homeassistant')
+        self.mqtt_uuid = self.cfg['boiler']['uuid'].replace('-','')
+        # command topics are <prefix>/<component>/<uuid>/<object_id>/set/<varname>
+        self.mqtt_command_prefix = f'{self.mqtt_ha_prefix}/'
 
         self.mqtt_client()
         self.mqtt_connect()
 
+        if _signal is not None:
+            # poll now with the new configuration instead of waiting for the next loop
+            self.next_poll_time = 0
+            self.wakeup_event.set()
+
+    def _resolve(self, cli_value, explicit: bool, section: str, key: str, default=None):
+        """ Returns the value of a setting, the command line prevails on the configuration file
+
+            :param cli_value: the value from the command line
+            :param explicit: True when the command line argument was given
+            :param section: the configuration file section
+            :param key: the key inside the section
+            :param default: the value when neither source sets it
+        """
+        if explicit:
+            return cli_value
+        return (self.cfg.get(section) or {}).get(key, default)
+
     def _restart(self):
         """ Stop, then start. """
         self._stop()
@@ -851,12 +1051,19 @@ class DiematicApp:
         if not self.mqtt_started and ('mqtt_broker' in self.args or 'mqtt' in self.cfg):
             self.mqtt_started = True
             try:
+                client_id = f"diematicd_{self.cfg['boiler']['uuid']}"
+                session = (self._mqtt_params(), client_id, self.mqtt_topic_available)
+                if self.mqtt_connected and session == self.mqtt_session:
+                    # nothing changed, keep the connection and its subscriptions
+                    return
                 if self.mqtt_connected:
                     self.mqttc.disconnect()
                     self.mqttc.loop_stop()
                     self.mqtt_loop_started = False
                 self.mqtt_connected = False
-                client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=f"diematicd_{self.cfg['boiler']['uuid']}", protocol=mqtt.MQTTv5)
+                self.mqtt_connecting = False
+                self.mqtt_session = session
+                client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5)
                 self.mqttc = client
                 client.on_connect = self.on_mqtt_connect
                 client.on_disconnect = self.on_mqtt_disconnect
@@ -871,22 +1078,28 @@ class DiematicApp:
             except Exception as e:
                 log.error('mqtt found in configuration file but connection raised the following error: {err}'.format(err=e))
 
+    def _mqtt_params(self):
+        """ Returns the (broker, port, user, password, tls) used to connect to the mqtt broker """
+        mqttk = self.cfg.get('mqtt') or {}
+        tls = self.mqtt_tls_explicit or mqttk.get('tls') is True
+        user = password = None
+        auth = 'mqtt_user' in self.args or 'user' in mqttk
+        if auth:
+            user = self._resolve(self.args.mqtt_user, self.mqtt_user_explicit, 'mqtt', 'user')
+            password = self._resolve(self.args.mqtt_password, self.mqtt_password_explicit, 'mqtt', 'password')
+        broker = self._resolve(self.args.mqtt_broker, self.mqtt_broker_explicit, 'mqtt', 'broker')
+        port = self._resolve(self.args.mqtt_port, self.mqtt_port_explicit, 'mqtt', 'port', 8883 if tls else 1883)
+        return (broker, port, user, password, tls)
+
     def mqtt_connect(self):
-        if not self.mqtt_connecting:
+        if not self.mqtt_connecting and not self.mqtt_connected:
             self.mqtt_connecting = True
             try:
-                mqttk = self.cfg.get('mqtt', None)
-                tls = self.mqtt_tls_explicit or (mqttk is not None and 'tls' in mqttk and mqttk.get('tls') is True)
+                broker, port, user, password, tls = self._mqtt_params()
                 if tls:
                     self.mqttc.tls_set(tls_version=ssl.PROTOCOL_TLSv1_2)
-                auth = 'mqtt_user' in self.args or (mqttk is not None and 'user' in mqttk)
-                if auth:
-                    user = self.args.mqtt_user if self.mqtt_user_explicit else mqttk.get('user', None) if mqttk is not None else None
-                    password = self.args.mqtt_password if self.mqtt_password_explicit else mqttk.get('password', None) if mqttk is not None else None
-                    if user is not None and password is not None:
-                        self.mqttc.username_pw_set(user, password)
-                broker = self.args.mqtt_broker if self.mqtt_broker_explicit else (mqttk.get('broker', None) if mqtt is not None else None)
-                port = self.args.mqtt_port if self.mqtt_port_explicit else mqttk.get('port', 8883 if tls else 1883) if mqttk is not None else 8883 if tls else 1883
+                if user is not None and password is not None:
+                    self.mqttc.username_pw_set(user, password)
                 connection = self.mqttc.connect(broker, port, 60, clean_start=True) if broker is not None and port is not None else 'Connection parameters are missing'
                 if connection != mqtt.MQTTErrorCode.MQTT_ERR_SUCCESS:
                     log.error(f'Can\'t connect to mqtt broker, error code is {connection}')
@@ -902,7 +1115,7 @@ class DiematicApp:
 
             self.mqttc.subscribe(HOMEASSISTANT_STATUS_TOPIC, 2)
         else:
-            log.info(f'MQTT Connected with code {rc}')
+            log.info('MQTT Connected with code %s', rc)
 
     def on_mqtt_disconnect(self, client, userdata, flags, rc, properties):
         self.mqtt_connected = False
@@ -912,17 +1125,18 @@ class DiematicApp:
         log.error('MQTT connect fail!')
 
     def on_mqtt_message(self, client, userdata, msg: mqtt.MQTTMessage):
-        log.info(f'Message: userdata:{userdata} topic:{msg.topic} payload:{str(msg.payload)} retained:{msg.retain}')
+        log.info('Message: userdata:%s topic:%s payload:%s retained:%s', userdata, msg.topic, msg.payload, msg.retain)
         if msg.topic == HOMEASSISTANT_STATUS_TOPIC:
             if self.parse_payload(msg.payload) == 'online':
-                self.shall_run_discovery = True if self.ha_discovery is not None else False
+                self.shall_run_discovery = self.ha_discovery is not None
                 self.mqtt_inform_available = True
             elif self.parse_payload(msg.payload) == 'offline':
                 self.force_set_offline = True
             return
-        topic_parts = msg.topic.split('/')
-        if len(topic_parts) > 5 and topic_parts[4] == 'set':
-            varname = topic_parts[5]
+        if not msg.topic.startswith(self.mqtt_command_prefix):
+            return
+        _, sep, varname = msg.topic.rpartition('/set/')
+        if sep and varname:
             value = self.parse_payload(msg.payload)
             if value is not None:
                 def callback():
@@ -936,16 +1150,14 @@ class DiematicApp:
                 self.check_pending_writes()
 
     def parse_payload(self, payload):
-        # json.loads(payload.decode('utf8'))
         if type(payload) is bytes:
-            decoded = payload.decode('utf8')
-            if len(decoded) > 0:
-                try:
-                    return json.loads(decoded)
-                except json.JSONDecodeError:
-                    pass
-                return decoded
-            return None
+            if not payload:
+                return None
+            try:
+                return loads_bytes(payload)
+            except ValueError:
+                # not json, the payload is a plain string
+                return payload.decode('utf8')
         log.error(f'unkown value type for payload {payload}')
         return None
 
@@ -964,10 +1176,10 @@ class DiematicApp:
 
     """Action functions dictionary."""
     action_funcs = {
+        'status': _status,
         'start': _start,
         'stop': _stop,
         'restart': _restart,
-        'status': _status,
         'reload': _reload,
         'runonce': _runonce,
         'readregister': _readregister,
@@ -985,9 +1197,8 @@ class DiematicApp:
             The action is specified by the `action` attribute, which is set
             during `parse_args`.
             """
-        try:
-            func = self.action_funcs[self.action]
-        except KeyError:
+        func = self.action_funcs.get(self.action)
+        if func is None:
             error = DaemonRunnerInvalidActionError(
                     "Unknown action: {action!r}".format(
                         action=self.action))
@@ -999,24 +1210,15 @@ class DiematicApp:
 
             :return: ``None``.
 
-            The action is specified by the `action` attribute, which is set
-            during `parse_args`.
+            The action function is resolved once by `parse_args` in the
+            `action_func` attribute.
             """
-        func = self._get_action_func()
+        func = self.action_func
         try:
             func(self)
         except DaemonRunnerError as e:
             log.error("{action!r} error: {errmsg}".format(action=self.action, errmsg=e))
 
-def ActionType(value):
-    try:
-        DiematicApp.action_funcs[value]
-    except KeyError:
-        error = DaemonRunnerInvalidActionError(
-                "Unknown action: {action!r}".format(action=value))
-        raise error
-    return value
-
 def _usage_exit(parser):
     """ Emit a usage message, then exit.
 
@@ -1033,6 +1235,46 @@ def _usage_exit(parser):
     # emit_message(message)
     sys.exit(usage_exit_code)
 
+def _get_parser():
+    """ Returns the command-line parser, it is built on the first call.
+
+        :return: the ``argparse.ArgumentParser`` of the daemon.
+        """
+    global _parser
+    if _parser is None:
+        parser = argparse.ArgumentParser(
+            description="Send data from Diematic boiler to web, influx database or mqtt broker",
+            epilog="Developed by Ignacio Hernández-Ros and distributed under the MIT license",
+            usage='%(prog)s [options]'
+        )
+        parser.add_argument(dest='action', choices=DiematicApp.action_funcs, default="runonce", help="action to take")
+        parser.add_argument("-b", "--backend", choices=['none', 'configured', 'influxdb', 'mqtt'], default='configured', help="select data backend (default is any configured in the configuration file)")
+        parser.add_argument("-d", "--device", help="define modbus device")
+        parser.add_argument("-f", "--foreground", help="Run in the foreground do not detach process", action="store_true")
+        parser.add_argument("-l", "--logging", choices=['critical', 'error', 'warning', 'info', 'debug'], help="define logging level (default is critical)")
+        parser.add_argument("-c", "--config", default='/etc/diematic/diematic.yaml', help="alternate configuration file")
+        parser.add_argument("-w", "--hostname", default="0.0.0.0", help="web server host name, defaults to 0.0.0.0")
+        parser.add_argument("-p", "--port", default=8080, help="web server port, defaults to 8080", type=int)
+        parser.add_argument("-s", "--server", choices=['loop','web','both'], default='both', help="servers to start")
+        parser.add_argument("-a", "--address", default=0, help="register address to read whe action is readregister", type=int)
+        parser.add_argument("-t", "--format", default='Raw', help="value format to apply for register read, default is Raw", choices=READ_FORMATS)
+        parser.add_argument("--influxdb-host", help="InfluxDB host name", type=str)
+        parser.add_argument("--influxdb-port", help="InfluxDB port", type=str)
+        parser.add_argument("--influxdb-user", help="InfluxDB user name", type=str)
+        parser.add_argument("--influxdb-password", help="InfluxDB user password", type=str)
+        parser.add_argument("--influxdb-database", help="InfluxDB database", type=str)
+        parser.add_argument("--mqtt-broker", help="MQTT Broker server, hostname or ip address", type=str)
+        parser.add_argument("--mqtt-port", help="MQTT Broker server, port", type=str)
+        parser.add_argument("--mqtt-tls", help="Use tls to connect to mqtt broker", action='store_true')
+        parser.add_argument("--mqtt-user", help="MQTT user name", type=str)
+        parser.add_argument("--mqtt-password", help="MQTT user password", type=str)
+        parser.add_argument("--mqtt-topic", help="Topic where the values will be published in mqtt broker", default="diematic2mqtt/boiler", type=str)
+        parser.add_argument("--mqtt-ha-discovery", help="if set, the service will publish Home Assistant Discovery topics", action='store_true')
+        parser.add_argument("--mqtt-ha-discovery-prefix", help="Home assistant topic prefix", default="homeassistant", type=str)
+        parser.add_argument("--mqtt-retain", help="set this parameter to retain messages in the broker, default is false", action='store_true')
+        _parser = parser
+    return _parser
+
 def parse_args(app, argv=None):
     """ Parse command-line arguments.
 
@@ -1050,63 +1292,33 @@ def parse_args(app, argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    # --------------------------------------------------------------------------- #
-    # retrieve command line arguments
-    # --------------------------------------------------------------------------- #
-    parser = argparse.ArgumentParser(
-        description="Send data from Diematic boiler to web, influx database or mqtt broker",
-        epilog="Developed by Ignacio Hernández-Ros and distributed under the MIT license",
-        usage='%(prog)s [options]'
-    )
-    parser.add_argument(dest='action', choices=['status', 'start', 'stop', 'restart', 'reload', 'runonce', 'readregister', 'writeregister'], default="runonce", help="action to take", type=ActionType)
-    parser.add_argument("-b", "--backend", choices=['none', 'configured', 'influxdb', 'mqtt'], default='configured', help="select data backend (default is any configured in the configuration file)")
-    parser.add_argument("-d", "--device", help="define modbus device")
-    parser.add_argument("-f", "--foreground", help="Run in the foreground do not detach process", action="store_true")
-    parser.add_argument("-l", "--logging", choices=['critical', 'error', 'warning', 'info', 'debug'], help="define logging level (default is critical)")
-    parser.add_argument("-c", "--config", default='/etc/diematic/diematic.yaml', help="alternate configuration file")
-    parser.add_argument("-w", "--hostname", default="0.0.0.0", help="web server host name, defaults to 0.0.0.0")
-    parser.add_argument("-p", "--port", default=8080, help="web server port, defaults to 8080", type=int)
-    parser.add_argument("-s", "--server", choices=['loop','web','both'], default='both', help="servers to start")
-    parser.add_argument("-a", "--address", default=0, help="register address to read whe action is readregister", type=int)
-    parser.add_argument("-t", "--format", default='Raw', help="value format to apply for register read, default is Raw", choices=['Raw', 'DiematicOneDecimal', 'DiematicModeFlag', 'ErrorCode', 'DiematicCircType', 'DiematicProgram', 'Model', 'bit0', 'bit1', 'bit2', 'bit3', 'bit4', 'bit5', 'bit6', 'bit7', 'bit8', 'bit9', 'bitA', 'bitB', 'bitC', 'bitD', 'bitE', 'bitF'])
-    parser.add_argument("--influxdb-host", help="InfluxDB host name", type=str)
-    parser.add_argument("--influxdb-port", help="InfluxDB port", type=str)
-    parser.add_argument("--influxdb-user", help="InfluxDB user name", type=str)
-    parser.add_argument("--influxdb-password", help="InfluxDB user password", type=str)
-    parser.add_argument("--influxdb-database", help="InfluxDB database", type=str)
-    parser.add_argument("--mqtt-broker", help="MQTT Broker server, hostname or ip address", type=str)
-    parser.add_argument("--mqtt-port", help="MQTT Broker server, port", type=str)
-    parser.add_argument("--mqtt-tls", help="Use tls to connect to mqtt broker", action='store_true')
-    parser.add_argument("--mqtt-user", help="MQTT user name", type=str)
-    parser.add_argument("--mqtt-password", help="MQTT user password", type=str)
-    parser.add_argument("--mqtt-topic", help="Topic where the values will be published in mqtt broker", default="diematic2mqtt/boiler", type=str)
-    parser.add_argument("--mqtt-ha-discovery", help="if set, the service will publish Home Assistant Discovery topics", action='store_true')
-    parser.add_argument("--mqtt-ha-discovery-prefix", help="Home assistant topic prefix", default="homeassistant", type=str)
-    parser.add_argument("--mqtt-retain", help="set this parameter to retain messages in the broker, default is false", action='store_true')
+    parser = _get_parser()
 
     if len(argv) < 1:
         _usage_exit(parser)
 
     app.args = parser.parse_args(argv)
-
-    app.hostname_explicit = '--hostname' in argv or "-w" in argv
-    app.port_explicit = '--port' in argv or "-p" in argv
-
-    app.mqtt_broker_explicit = '--mqtt-broker' in argv
-    app.mqtt_tls_explicit = '--mqtt-tls' in argv
-    app.mqtt_port_explicit = '--mqtt-port' in argv
-    app.mqtt_ha_discovery_explicit = '--mqtt-ha-discovery' in argv
-    app.mqtt_ha_discovery_prefix_explicit = '--mqtt-ha-discovery-prefix' in argv
-    app.mqtt_retain_explicit = '--mqtt-retain' in argv
-    app.mqtt_topic_explicit = '--mqtt-topic' in argv
-    app.mqtt_user_explicit = '--mqtt-user' in argv
-    app.mqtt_password_explicit = '--mqtt-password' in argv
-
-    app.influxdb_host_explicit = '--influxdb-host' in argv
-    app.influxdb_port_explicit = '--influxdb-port' in argv
-    app.influxdb_user_explicit = '--influxdb-user' in argv
-    app.influxdb_password_explicit = '--influxdb-password' in argv
-    app.influxdb_database_explicit = '--influxdb-database' in argv
+    # option names given, with or without the '=value' form
+    argv_set = {arg.split('=', 1)[0] for arg in argv}
+
+    app.hostname_explicit = '--hostname' in argv_set or "-w" in argv_set
+    app.port_explicit = '--port' in argv_set or "-p" in argv_set
+
+    app.mqtt_broker_explicit = '--mqtt-broker' in argv_set
+    app.mqtt_tls_explicit = '--mqtt-tls' in argv_set
+    app.mqtt_port_explicit = '--mqtt-port' in argv_set
+    app.mqtt_ha_discovery_explicit = '--mqtt-ha-discovery' in argv_set
+    app.mqtt_ha_discovery_prefix_explicit = '--mqtt-ha-discovery-prefix' in argv_set
+    app.mqtt_retain_explicit = '--mqtt-retain' in argv_set
+    app.mqtt_topic_explicit = '--mqtt-topic' in argv_set
+    app.mqtt_user_explicit = '--mqtt-user' in argv_set
+    app.mqtt_password_explicit = '--mqtt-password' in argv_set
+
+    app.influxdb_host_explicit = '--influxdb-host' in argv_set
+    app.influxdb_port_explicit = '--influxdb-port' in argv_set
+    app.influxdb_user_explicit = '--influxdb-user' in argv_set
+    app.influxdb_password_explicit = '--influxdb-password' in argv_set
+    app.influxdb_database_explicit = '--influxdb-database' in argv_set
 
     app.mqtt_connected = False
     app.mqtt_connecting = False
@@ -1115,9 +1327,9 @@ def parse_args(app, argv=None):
 
     app.action = app.args.action
     if app.args.action == 'runonce':
-        if not ('-b' in argv or '--backend' in argv):
+        if not ('-b' in argv_set or '--backend' in argv_set):
             app.args.backend = 'none'
-        if not ('-l' in argv or '--loggin' in argv):
+        if not ('-l' in argv_set or '--logging' in argv_set):
             app.args.logging = 'info'
 
     if app.args.action == 'readregister' or app.args.action == 'writeregister':
@@ -1125,13 +1337,51 @@ def parse_args(app, argv=None):
 
     if app.action not in app.action_funcs:
         _usage_exit(parser)
+    app.action_func = app._get_action_func()
 
 def emit_message(message, stream=None):
     """ Emit a message to the specified stream (default `sys.stderr`). """
-    if stream is None:
-        stream = sys.stderr
-    stream.write("{message}\n".format(message=message))
-    stream.flush()
+    print(message, file=stream or sys.stderr, flush=True)
+
+def retry_delay(attempt):
+    """ Seconds to wait before repeating a failed modbus operation.
+
+        The delay doubles with every failed ``attempt`` (starting at 1) up to
+        ``MODBUS_RETRY_MAX_DELAY`` and is randomized between half and the full
+        value so processes sharing the bus don't retry in lockstep.
+    """
+    delay = min(MODBUS_RETRY_DELAY * (1 << (attempt - 1)), MODBUS_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+def merge_register_ranges(ranges, merge_gap, max_count=MODBUS_MAX_READ_COUNT):
+    """ Group the configured register ranges in as few read requests as possible.
+
+        Two ranges are read together when no more than ``merge_gap``
+        registers are between them and the request does not exceed
+        ``max_count`` registers.
+
+        :return: a list of ``(read_start, read_stop, ranges)`` tuples, where
+            ``ranges`` are the ``(start, stop)`` ranges covered by the read
+        """
+    disjoint = []
+    for start, stop in sorted((r[0], r[1]) for r in ranges):
+        if disjoint and start <= disjoint[-1][1] + 1:
+            disjoint[-1][1] = max(disjoint[-1][1], stop)
+        else:
+            disjoint.append([start, stop])
+
+    reads = []
+    for start, stop in disjoint:
+        while start <= stop:
+            chunk_stop = min(stop, start + max_count - 1)
+            if reads and start - reads[-1][1] - 1 <= merge_gap and chunk_stop - reads[-1][0] < max_count:
+                reads[-1][1] = chunk_stop
+                reads[-1][2].append((start, chunk_stop))
+            else:
+                reads.append([start, chunk_stop, [(start, chunk_stop)]])
+            start = chunk_stop + 1
+
+    return [tuple(read) for read in reads]
 
 def make_pidlockfile(path, acquire_timeout):
     """ Make a PIDLockFile instance with the given filesystem path. """
@@ -1147,42 +1397,42 @@ def make_pidlockfile(path, acquire_timeout):
 
     return lockfile
 
-def is_pidfile_stale(pidfile):
-    """ Determine whether a PID file is stale.
+def probe_pidfile(pidfile):
+    """ Read the PID file and check if its process is running.
 
-        :return: ``True`` if the PID file is stale; otherwise ``False``.
+        :return: a ``(pid, running, stale)`` tuple, ``pid`` is ``None``
+            when the PID file does not exist.
 
         The PID file is “stale” if its contents are valid but do not
         match the PID of a currently-running process.
         """
-    result = False
-
     pidfile_pid = pidfile.read_pid()
-    if pidfile_pid is not None:
-        try:
-            os.kill(pidfile_pid, signal.SIG_DFL)
-        except ProcessLookupError:
-            # The specified PID does not exist.
-            result = True
+    if pidfile_pid is None:
+        return (None, False, False)
+    try:
+        # signal 0 only checks the process exists
+        os.kill(pidfile_pid, 0)
+    except ProcessLookupError:
+        # The specified PID does not exist.
+        return (pidfile_pid, False, True)
+    except PermissionError:
+        # The process exists but belongs to another user.
+        pass
+    return (pidfile_pid, True, False)
+
+def is_pidfile_stale(pidfile):
+    """ Determine whether a PID file is stale.
 
-    return result
+        :return: ``True`` if the PID file is stale; otherwise ``False``.
+        """
+    return probe_pidfile(pidfile)[2]
 
 def is_process_already_running(pidfile):
     """ Determine if the process indicated by the pidfile is already
         running.
         :return: ``True`` if the process pointed to by the pid file is running
         """
-    result = False
-    pidfile_pid = pidfile.read_pid()
-    if pidfile_pid is not None:
-        try:
-            os.kill(pidfile_pid, signal.SIG_DFL)
-            result = True
-        except ProcessLookupError:
-            # The specified PID does not exist.
-            pass
-
-    return result
+    return probe_pidfile(pidfile)[1]
 
 if __name__ == '__main__':
     app = DiematicApp()
@@ -5,86 +5,29 @@ aiohttp.client_exceptions.ClientPayloadError: Response payload is not completed
 problems on the client side. Let's see how it works!
 """
 
-import json
-from aiohttp import web
+import asyncio
+import gzip
+import hashlib
+import html
+from urllib.parse import quote
+from aiohttp import hdrs, web
+from boiler import dumps_bytes, loads_bytes
 
-# def _parameter_names(boiler) -> list:
-# 	parameter_names = []
-# 	for register in boiler.index:
-# 		if register['type'] == 'bits':
-# 			for bit in register['bits']:
-# 				if bit != "io_unused":
-# 					parameter_names.append(bit)
-# 		else:
-# 			parameter_names.append(register['name'])
-# 	parameter_names.sort()
-# 	return parameter_names
-
-
-class DiematicWebRequestHandler:
-	""" 
-		This class implements the web server that provides GET and POST
-		requests for the parameters of the boiler
-
-		The parameters are defined in the same diematic.yaml file
+def _json_response(data) -> web.Response:
+	""" Returns a JSON response, data may be already encoded as bytes """
+	body = data if type(data) is bytes else dumps_bytes(data)
+	return web.Response(body=body, content_type='application/json', charset='utf-8')
 
-		URL format:
-		GET http://{host:port}/diematic/parameters
-		returns a list of known parameters from the diematic.yaml
+def _parameter_item(name: str) -> str:
+	""" Returns the <li> of a parameter in the send_list page, name is escaped for the url, the javascript string and the html """
+	url = html.escape(quote(name, safe=''))
+	js = html.escape(name.replace('\\', '\\\\').replace("'", "\\'"))
+	return f"<li><a href='/diematic/parameters/{url}'>{html.escape(name)}</a>&nbsp;<button type=\"button\" onclick=\"changeValue('{js}')\">change</button>&nbsp;<button type=\"button\" onclick=\"resumeSetValue('{js}')\">Resume</button></li>\n"
 
-		GET http://{host:port}/diematic/parameters/{parameterName}
-		return a JSON 
-		{
-			"name": "parameterName",
-			"status": "read",
-			"value": 34,
-			"id": 680,
-			"influx": true,
-			"read": "2022-04-02T17:21:32.751479"
-		}
+PAGE_CACHE_SIZE = 8 # rendered send_list pages kept, one per scheme and host
 
-		name: is the parameter name
-		status: can be:
-			"init": the value has not been read, the record is initialized
-			"read": the value has been read
-			"writepending": there is a new value pending to be written
-			"checking": the value has been written, the boiler is pending reading to check if the new value has been successfully set
-			"error": a problem occurred while setting the value
-		value: the parameter value
-		read: the last time the value was set
-		newvalue: when status is "writepending" this record holds the value to be written
-		error: the error message when status is "error"
-
-		POST http://{host}/diematic/parameters/{parameterName}
-		body must contain a json
-		{
-			"parameterName": value
-		}
-	"""
-
-	routes = web.RouteTableDef()
-	parameter_names = []
-
-	def __init__(self, boiler) -> None:
-		DiematicWebRequestHandler.parameter_names.clear()
-		for register in boiler.index:
-			if 'type' in list(register) and register['type'] == 'bits':
-				for bit in register['bits']:
-					if type(bit) is str:
-						if bit != "io_unused":
-							DiematicWebRequestHandler.parameter_names.append(bit)
-					elif type(bit) is dict:
-						DiematicWebRequestHandler.parameter_names.append(bit['name'])
-			elif 'name' in list(register):
-				DiematicWebRequestHandler.parameter_names.append(register['name'])
-		DiematicWebRequestHandler.parameter_names.sort()
-
-	@routes.get('/diematic/parameters')
-	async def send_list(request):
-		""" produces a list of well known register names."""
-		scheme = request.scheme
-		host = request.host
-		document = f"""
+# page shown by send_list, {scheme} and {host} are filled in per request and the parameter list follows
+_LIST_PAGE_TEMPLATE = """
 <html>
 	<head>
 		<title>Diematic REST controller by IHR at home (Ignacio Hernández-Ros)</title>
@@ -167,52 +110,155 @@ class DiematicWebRequestHandler:
 	</table>
 	<p>Recognized parameters list</p>
 	<ul>"""
-		for name in DiematicWebRequestHandler.parameter_names:
-			document = document + f"<li><a href='/diematic/parameters/{name}'>{name}</a>&nbsp;<button type=\"button\" onclick=\"changeValue(\'{name}\')\">change</button>&nbsp;<button type=\"button\" onclick=\"resumeSetValue(\'{name}\')\">Resume</button></li>\n"
-		document = document + """</ul></body></html>"""
-		return web.Response(text=document, content_type='text/html')
-
-	@routes.get('/diematic/parameters/{paramName}')
-	async def send_param(request):
-		param_name = request.match_info.get('paramName')
-		if not param_name in DiematicWebRequestHandler.parameter_names:
-			return web.Response(status=422, reason=f'\'{param_name}\' is an invalid parameter')
+
+# def _parameter_names(boiler) -> list:
+# 	parameter_names = []
+# 	for register in boiler.index:
+# 		if register['type'] == 'bits':
+# 			for bit in register['bits']:
+# 				if bit != "io_unused":
+# 					parameter_names.append(bit)
+# 		else:
+# 			parameter_names.append(register['name'])
+# 	parameter_names.sort()
+# 	return parameter_names
+
+
+class DiematicWebRequestHandler:
+	""" 
+		This class implements the web server that provides GET and POST
+		requests for the parameters of the boiler
+
+		The parameters are defined in the same diematic.yaml file
+
+		URL format:
+		GET http://{host:port}/diematic/parameters
+		returns a list of known parameters from the diematic.yaml
+
+		GET http://{host:port}/diematic/parameters/{parameterName}
+		return a JSON 
+		{
+			"name": "parameterName",
+			"status": "read",
+			"value": 34,
+			"id": 680,
+			"influx": true,
+			"read": "2022-04-02T17:21:32.751479"
+		}
+
+		name: is the parameter name
+		status: can be:
+			"init": the value has not been read, the record is initialized
+			"read": the value has been read
+			"writepending": there is a new value pending to be written
+			"checking": the value has been written, the boiler is pending reading to check if the new value has been successfully set
+			"error": a problem occurred while setting the value
+		value: the parameter value
+		read: the last time the value was set
+		newvalue: when status is "writepending" this record holds the value to be written
+		error: the error message when status is "error"
+
+		POST http://{host}/diematic/parameters/{parameterName}
+		body must contain a json
+		{
+			"parameterName": value
+		}
+	"""
+
+	def __init__(self, boiler) -> None:
+		names = []
+		for register in boiler.index:
+			if register.get('type') == 'bits':
+				for bit in register['bits']:
+					if type(bit) is str:
+						if bit != "io_unused":
+							names.append(bit)
+					elif type(bit) is dict:
+						names.append(bit['name'])
+			elif 'name' in register:
+				names.append(register['name'])
+		names.sort()
+		self.parameter_names = names
+		self.parameter_names_set = frozenset(names)
+		# the parameter list does not change while the server runs, render and encode it once
+		self.parameter_list_bytes = (''.join(map(_parameter_item, names)) + """</ul></body></html>""").encode('utf-8')
+		self.page_cache = {}
+		# routes bound to this instance, for web.Application.add_routes
+		self.routes = [
+			web.get('/diematic/parameters', self.send_list),
+			web.get('/diematic/parameters/{paramName}', self.send_param),
+			web.post('/diematic/parameters/{paramName}', self.set_param),
+			web.post('/diematic/parameters/{paramName}/resume', self.set_param_resume),
+			web.get('/diematic/json', self.send_json),
+			web.get('/diematic/config', self.send_config),
+		]
+
+	def _param_name(self, request) -> str:
+		""" Returns the parameter name of the request url, raises HTTPUnprocessableEntity if it is not known """
+		param_name = request.match_info['paramName']
+		if not param_name in self.parameter_names_set:
+			raise web.HTTPUnprocessableEntity(reason=f'\'{param_name}\' is an invalid parameter', body=b'')
+		return param_name
+
+	async def send_list(self, request):
+		""" produces a list of well known register names."""
+		key = (request.scheme, request.host)
+		page_cache = self.page_cache
+		page = page_cache.get(key)
+		if page is None:
+			document = _LIST_PAGE_TEMPLATE.format(scheme=request.scheme, host=request.host)
+			body = document.encode('utf-8') + self.parameter_list_bytes
+			# compressed once, gzip clients get it without any work per request
+			page = (body, gzip.compress(body, mtime=0))
+			# the host comes from the request headers, do not let clients grow the cache without limit
+			if len(page_cache) >= PAGE_CACHE_SIZE:
+				page_cache.clear()
+			page_cache[key] = page
+		if 'gzip' in request.headers.get(hdrs.ACCEPT_ENCODING, '').lower():
+			return web.Response(body=page[1], content_type='text/html', charset='utf-8', headers={hdrs.CONTENT_ENCODING: 'gzip', hdrs.VARY: hdrs.ACCEPT_ENCODING})
+		response = web.Response(body=page[0], content_type='text/html', charset='utf-8')
+		response.enable_compression()
+		return response
+
+	async def send_param(self, request):
+		param_name = self._param_name(request)
 		boiler = request.app["mainapp"].MyBoiler
-		value = getattr(boiler, param_name)
-		return web.json_response(value)
-
-	@routes.post('/diematic/parameters/{paramName}')
-	async def set_param(request):
-		param_name = request.match_info.get('paramName')
-		if not param_name in DiematicWebRequestHandler.parameter_names:
-			return web.Response(status=422, reason=f'\'{param_name}\' is an invalid parameter')
-		content_len = request.content_length
-		if not content_len is None:
-			data = await request.content.read(content_len)
+		body = dumps_bytes(boiler.vars[param_name].copy())
+		# clients polling a parameter get a 304 without body while it does not change
+		etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+		if_none_match = request.if_none_match
+		if if_none_match and any(tag.value == etag for tag in if_none_match):
+			response = web.Response(status=304)
 		else:
-			data = await request.content.read()
-		jsoninput = json.loads(data.decode('utf8'))
+			response = _json_response(body)
+		response.etag = etag
+		return response
+
+	async def set_param(self, request):
+		param_name = self._param_name(request)
+		jsoninput = loads_bytes(await request.read())
 		value = jsoninput['value']
 		mainapp = request.app["mainapp"]
 		mainapp.MyBoiler.set_write_pending(param_name, value)
 		mainapp.check_pending_writes()
 		return web.Response()
 
-	@routes.post('/diematic/parameters/{paramName}/resume')
-	async def set_param_resume(request):
-		param_name = request.match_info.get('paramName')
-		if not param_name in DiematicWebRequestHandler.parameter_names:
-			return web.Response(status=422, reason=f'\'{param_name}\' is an invalid parameter')
+	async def set_param_resume(self, request):
+		param_name = self._param_name(request)
 		mainapp = request.app["mainapp"]
 		mainapp.MyBoiler.clear_error(param_name)
 		return web.Response()
 
-	@routes.get('/diematic/json')
-	async def send_json(request):
-		config = request.app["mainapp"].MyBoiler.toJSON()
-		return web.json_response(config)
+	async def send_json(self, request):
+		# json_bytes waits for the boiler lock while registers are being decoded, keep it out of the event loop
+		config = await asyncio.get_running_loop().run_in_executor(None, request.app["mainapp"].MyBoiler.json_bytes)
+		response = _json_response(config)
+		# gzip or deflate, as accepted by the client
+		response.enable_compression()
+		return response
 
-	@routes.get('/diematic/config')
-	async def send_config(request):
-		config = request.app["mainapp"].toJSON()
-		return web.json_response(config)
\ No newline at end of file
+	async def send_config(self, request):
+		config = await asyncio.get_running_loop().run_in_executor(None, dumps_bytes, request.app["mainapp"].toJSON())
+		response = _json_response(config)
+		response.enable_compression()
+		return response
\ No newline at end of file
@@ -10,12 +10,28 @@ this saves the number of records in the diematic.yaml file and the number
 of records to he read and processed on every loop
 """
 import argparse
+import json
 import yaml
 import sys
 
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper) # libyaml emitter when PyYAML is built with it
+
+def half_hour_slots():
+	"""Returns the 48 half hours of a day formatted as in the variable names, like 0000_0030"""
+	slots = []
+	for starthour in range(0,24):
+		for startminute in ('00', '30'):
+			endhour = starthour if startminute == '00' else starthour + 1
+			if endhour == 24:
+				endhour = 0
+			endminute = '30' if startminute == '00' else '00'
+			slots.append(f"{starthour:02}{startminute}_{endhour:02}{endminute}")
+	return tuple(slots)
+
 class ConfigBuilder:
 	"""A class to encapsulate code for the configurator builder"""
-	days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+	days = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+	slots = half_hour_slots() # formatted once for all days and circuits
 
 	circuits = [
 		{
@@ -44,52 +60,40 @@ class ConfigBuilder:
 			'exec': False,
 		},
 	]
+	active_circuits = tuple(circuit for circuit in circuits if circuit['exec'])
 
 	def __init__(self) -> None:
 		args = sys.argv[1:]
 		parser = argparse.ArgumentParser()
 		parser.add_argument("-p", "--password", help="InfluxDB password", default="infpassword")
+		parser.add_argument("-f", "--format", help="output format, json is also valid yaml", choices=['yaml', 'json'], default='yaml')
 		
 		self.args = parser.parse_args(args)
 
-	def build(self):
+	def circuit_registers(self, circuit):
+		"""Returns the registers with the activation times of a circuit"""
 		data = []
+		register = circuit['register']
+		cname = circuit['name']
+		for day in self.days:
+			# every register holds 16 consecutive half hours, listed in reverse order
+			for first in range(0, len(self.slots), 16):
+				bits = [f"{day}_{cname}_{slot}" for slot in self.slots[first:first+16]]
+				bits.reverse()
+				data.append({
+					'id': register,
+					'type': 'bits',
+					'ha': True,
+					'bits': bits,
+				})
+				register += 1
+		return data
 
-		for circuit in self.circuits:
-			if not circuit['exec']:
-				continue
-			register = circuit['register']
-			cname = circuit['name']
-			for day in self.days:
-				line=0
-				newline=True
-				for starthour in range(0,24):
-					for startminute in ['00', '30']:
-						if newline:
-							# hr = []
-							endhour = starthour + 8 if starthour < 16 else 00
-							entry = {
-								'id': register,
-								'type': 'bits',
-								'ha': True,
-								'bits': [],
-							}
-							register += 1
-							data.append(entry)
-							newline = False
+	def build(self):
+		data = []
 
-						endhour = starthour if startminute == '00' else starthour + 1
-						if endhour == 24:
-							endhour = 0
-						
-						endminute = '30' if startminute == '00' else '00'
-						varname = f"{day}_{cname}_{starthour:02}{startminute}_{endhour:02}{endminute}"
-						data[len(data)-1]['bits'].append(varname)
-						line += 1
-						if line == 16:
-							line = 0
-							newline=True
-							data[len(data)-1]['bits'].reverse()
+		for circuit in self.active_circuits:
+			data.extend(self.circuit_registers(circuit))
 
 		config = {
 			"logging": "critical",
@@ -116,8 +120,16 @@ class ConfigBuilder:
 
 		return config
 
-if __name__ == '__main__':
+def main():
+	"""Prints the generated configuration in the selected format"""
 	cbuilder = ConfigBuilder()
 	config = cbuilder.build()
-	yamlConfig = yaml.safe_dump(config, sort_keys=False)
-	print(yamlConfig)
\ No newline at end of file
+	# written while serializing, the whole document is never held in a string
+	if cbuilder.args.format == 'json':
+		json.dump(config, sys.stdout, indent=2)
+		print()
+	else:
+		yaml.dump(config, sys.stdout, Dumper=YAML_DUMPER, sort_keys=False)
+
+if __name__ == '__main__':
+	main()